@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+
+class PoolBusy(Exception):
+    """Черга запитів до ШІ заповнена"""
+
+
+class AIWorkerPool:
+    """Фіксований пул воркерів для запитів до ШІ з обмеженою чергою.
+
+    Кожен запит має дедлайн, що враховує і час очікування в черзі. Запит, який не вклався
+    в дедлайн або від якого відмовився виклик, скасовується, і воркер одразу береться за наступний.
+    """
+
+    def __init__(self, workers=8, max_queue=50):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._queue = None
+        self._tasks = []
+
+    def _ensure_started(self):
+        if not self._tasks:
+            self._queue = asyncio.Queue(self.max_queue)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def run(self, job, timeout):
+        """Виконує корутину job() у пулі; кидає PoolBusy, якщо черга заповнена"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((job, future, time.monotonic() + timeout))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise PoolBusy()
+        return await future
+
+    async def _worker(self):
+        while True:
+            job, future, deadline = await self._queue.get()
+            try:
+                await self._execute(job, future, deadline)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job, future, deadline):
+        if future.done():
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.timeouts += 1
+            future.set_exception(asyncio.TimeoutError())
+            return
+
+        self.busy += 1
+        task = asyncio.ensure_future(job())
+        future.add_done_callback(lambda f: task.cancel() if f.cancelled() else None)
+        try:
+            result = await asyncio.wait_for(task, remaining)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+        except asyncio.CancelledError:
+            # якщо виклик перестав чекати, скасовано лише запит, а воркер працює далі
+            if not future.cancelled():
+                future.cancel()
+                raise
+        except Exception as e:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.completed += 1
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self.busy -= 1
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "saturation": self.busy / self.workers,
+            "queue_length": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
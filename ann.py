@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+
+CENTROIDS_FILE = "ivf_centroids.npy"
+OFFSETS_FILE = "ivf_offsets.npy"
+
+
+def kmeans(vectors, nlist, iterations=10, sample=100000, seed=0, batch=65536):
+    """Сферичний k-means на випадковій вибірці нормованих векторів; повертає нормовані центроїди"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[np.sort(rng.choice(len(vectors), sample, replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(vectors, centroids, batch)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = np.bincount(labels, minlength=nlist) == 0
+        # порожній кластер отримує випадковий вектор, щоб не втрачати списки
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms > 0, norms, 1)
+    return centroids
+
+
+def assign(vectors, centroids, batch=65536):
+    """Номер найближчого центроїда для кожного вектора (рахується пачками, щоб не тримати всю матрицю)"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch):
+        labels[start:start + batch] = np.argmax(np.asarray(vectors[start:start + batch]) @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """Інвертований індекс: вектори згруповані за найближчим центроїдом у суцільні діапазони рядків.
+
+    Пошук рахує косинус лише для nprobe найближчих груп, тобто для малої частки каталогу. Оскільки
+    група — це неперервний зріз того самого memmap-масиву, читаються лише потрібні сторінки.
+    """
+
+    def __init__(self, centroids, offsets, nprobe=32):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, vectors, nlist=None, iterations=10, seed=0):
+        """Повертає (індекс, order): рядки vectors треба переставити в порядку order"""
+        nlist = min(nlist or int(4 * np.sqrt(len(vectors))), len(vectors))
+        centroids = kmeans(vectors, nlist, iterations, seed=seed)
+        labels = assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        return cls(centroids, offsets), order
+
+    def save(self, path):
+        np.save(os.path.join(path, CENTROIDS_FILE), self.centroids)
+        np.save(os.path.join(path, OFFSETS_FILE), self.offsets)
+
+    @classmethod
+    def load(cls, path, nprobe=32):
+        if not os.path.exists(os.path.join(path, CENTROIDS_FILE)):
+            return None
+        return cls(np.load(os.path.join(path, CENTROIDS_FILE)), np.load(os.path.join(path, OFFSETS_FILE)), nprobe)
+
+    def probe(self, query, nprobe=None):
+        """Діапазони рядків (start, end) у nprobe групах, найближчих до запиту"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        scores = self.centroids @ query
+        lists = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return [(self.offsets[i], self.offsets[i + 1]) for i in lists if self.offsets[i + 1] > self.offsets[i]]
+
+    def search(self, vectors, query, nprobe=None):
+        """Повертає (номери рядків, косинуси) кандидатів з найближчих груп"""
+        ranges = self.probe(query, nprobe)
+        if not ranges:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([np.asarray(vectors[start:end]) @ query for start, end in ranges])
+        return rows, scores
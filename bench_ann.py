@@ -0,0 +1,100 @@
+"""Повнота і затримка IVF-пошуку порівняно з точним косинусним пошуком.
+
+За замовчуванням генерує кластеризовані вектори розміру каталогу TMDB; з --index бере вектори
+та IVF готового індексу схожості (python similarity.py build ...).
+
+    python bench_ann.py --films 900000 --queries 200
+    python bench_ann.py --index data/similarity
+"""
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from ann import IVFIndex
+
+
+def synthetic_vectors(films, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = np.empty((films, dim), dtype=np.float32)
+    for start in range(0, films, 100000):
+        end = min(start + 100000, films)
+        labels = rng.integers(0, clusters, end - start)
+        vectors[start:end] = centers[labels] + 1.5 * rng.standard_normal((end - start, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def top_k(rows, scores, k):
+    top = np.argpartition(-scores, k)[:k + 1]
+    return rows[top[np.argsort(-scores[top])]][1:k + 1]
+
+
+def percentile_ms(samples, q):
+    return np.percentile(samples, q) * 1000
+
+
+def main(args):
+    if args.index:
+        from similarity import SimilarityIndex
+        start = time.perf_counter()
+        index = SimilarityIndex.load(args.index)
+        print(f"loaded {len(index)} films in {(time.perf_counter() - start) * 1000:.1f} ms")
+        vectors, ivf = index.vectors, index.ivf
+        if ivf is None:
+            raise SystemExit("index has no IVF part, rebuild it with nlist > 0")
+    else:
+        vectors = synthetic_vectors(args.films, args.dim, args.clusters)
+        start = time.perf_counter()
+        ivf, order = IVFIndex.build(vectors, args.nlist)
+        vectors = vectors[order]
+        print(f"built IVF with {len(ivf.centroids)} lists over {len(vectors)} vectors in {time.perf_counter() - start:.1f}s")
+        # як у боті: вектори зберігаються на диск і відкриваються через mmap
+        path = tempfile.mkdtemp()
+        np.save(os.path.join(path, "vectors.npy"), vectors)
+        start = time.perf_counter()
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        print(f"mmap open: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    rng = np.random.default_rng(1)
+    queries = rng.choice(len(vectors), args.queries, replace=False)
+    all_rows = np.arange(len(vectors))
+
+    exact, timings = [], []
+    for i in queries:
+        query = np.asarray(vectors[i])
+        start = time.perf_counter()
+        exact.append(set(top_k(all_rows, np.asarray(vectors @ query), args.k).tolist()))
+        timings.append(time.perf_counter() - start)
+    print(f"\n{'search':>12} {'recall@' + str(args.k):>10} {'p50, ms':>9} {'p95, ms':>9} {'scanned':>8}")
+    print(f"{'exact':>12} {1:>10.3f} {percentile_ms(timings, 50):>9.2f} {percentile_ms(timings, 95):>9.2f} {1:>8.1%}")
+
+    for nprobe in args.nprobe:
+        hits, timings, scanned = 0, [], 0
+        for i, expected in zip(queries, exact):
+            query = np.asarray(vectors[i])
+            start = time.perf_counter()
+            rows, scores = ivf.search(vectors, query, nprobe)
+            found = top_k(rows, scores, args.k) if len(rows) > args.k else rows
+            timings.append(time.perf_counter() - start)
+            hits += len(expected & set(found.tolist()))
+            scanned += len(rows)
+        recall = hits / (args.k * len(queries))
+        share = scanned / len(queries) / len(vectors)
+        print(f"{'ivf/' + str(nprobe):>12} {recall:>10.3f} {percentile_ms(timings, 50):>9.2f} {percentile_ms(timings, 95):>9.2f} {share:>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="папка індексу схожості замість синтетичних даних")
+    parser.add_argument("--films", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    main(parser.parse_args())
@@ -0,0 +1,102 @@
+"""Мікробенчмарк маршрутизації повідомлень.
+
+Порівнює старий ланцюжок func-фільтрів telebot (кожне оновлення перевіряється всіма лямбдами
+по черзі, а фільтри кроків щоразу читають сесію) з Router: один обробник, одне читання сесії
+і два пошуки у словниках. Обробники порожні, сесії в пам'яті, тому міряється лише вартість
+маршрутизації одного оновлення.
+
+    python bench_dispatch.py --updates 20000 --extra 0 50 200
+"""
+import time
+import asyncio
+import argparse
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from router import Router
+from sessions import Session, MemorySessionStore
+
+TEXTS = [
+    "🔁 Повторити підбір", "🔁 Повторити пошук схожих", "🗑 Очистити історію",
+    "📜 Історія рекомендацій", "⬅️ Повернутись в головне меню", "🔍 Новий підбір фільмів",
+]
+STEPS = ["similar", "genre", "favorites", "preferences"]
+
+# (назва, текст повідомлення, крок сесії); остання — назва фільму, яку ловить лише останній фільтр
+CASES = [
+    ("button", "🔍 Новий підбір фільмів", "done"),
+    ("step", "драма", "favorites"),
+    ("fallback", "Інтерстеллар (2014)", "done"),
+]
+
+
+async def handler(message):
+    pass
+
+
+def make_linear_bot(sessions, extra):
+    bot = AsyncTeleBot("1:bench")
+    for i in range(extra):
+        bot.register_message_handler(handler, func=lambda msg, text=f"extra {i}": msg.text == text)
+    for text in TEXTS:
+        bot.register_message_handler(handler, func=lambda msg, text=text: msg.text == text)
+    for step in STEPS:
+        async def check(msg, step=step):
+            return (await sessions.get(msg.chat.id)).step == step
+        bot.register_message_handler(handler, func=check)
+
+    async def has_recommendations(msg):
+        return bool((await sessions.get(msg.chat.id)).recommendations)
+    bot.register_message_handler(handler, func=has_recommendations)
+    return bot
+
+
+def make_router_bot(sessions, extra):
+    bot = AsyncTeleBot("1:bench")
+    router = Router()
+    router.text(*TEXTS, *(f"extra {i}" for i in range(extra)))(handler)
+    router.step(*STEPS)(handler)
+
+    async def dispatch_message(message):
+        session = await sessions.get(message.chat.id)
+        route = router.resolve(message.text, session.step)
+        if route is None and session.recommendations:
+            route = handler
+        if route is not None:
+            await route(message)
+    bot.register_message_handler(dispatch_message, content_types=["text"])
+    return bot
+
+
+def make_update(update_id, text):
+    return types.Update.de_json({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": text,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+    }})
+
+
+async def measure(bot, text, updates):
+    batch = [make_update(i, text) for i in range(updates)]
+    start = time.perf_counter()
+    for update in batch:
+        await bot.process_new_updates([update])
+    return (time.perf_counter() - start) / updates * 1e6
+
+
+async def main(args):
+    print(f"{'handlers':>8} {'case':>9} {'linear, us':>11} {'router, us':>11} {'speedup':>8}")
+    for extra in args.extra:
+        for name, text, step in CASES:
+            sessions = MemorySessionStore()
+            await sessions.save(Session(1, step=step, recommendations=["Інтерстеллар (2014)"]))
+            linear = await measure(make_linear_bot(sessions, extra), text, args.updates)
+            routed = await measure(make_router_bot(sessions, extra), text, args.updates)
+            print(f"{len(TEXTS) + len(STEPS) + 1 + extra:>8} {name:>9} {linear:>11.1f} {routed:>11.1f} {linear / routed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--extra", type=int, nargs="+", default=[0, 50, 200],
+                        help="скільки додаткових кнопок зареєструвати, щоб показати залежність від їх кількості")
+    asyncio.run(main(parser.parse_args()))
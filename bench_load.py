@@ -0,0 +1,396 @@
+"""Навантажувальний тест обробників бота без Telegram, g4f і TMDB.
+
+Піднімає в окремих процесах заглушки Bot API, TMDB і OpenAI-сумісного чату (замість g4f) з
+налаштовуваною затримкою та часткою помилок, імпортує main.py (або debug.py) з адресами заглушок
+і проганяє через bot.process_new_updates() діалог багатьох користувачів одночасно:
+/start → новий підбір → жанр → улюблені фільми → побажання → картка першого рекомендованого фільму.
+У межах одного користувача повідомлення йдуть по черзі, як їх доставляє Telegram.
+
+Показує оновлення за секунду, перцентилі часу обробки кожного кроку, скільки користувачів
+отримали рекомендації, кількість викликів заглушок і приріст пам'яті процесу бота.
+
+    python bench_load.py --users 2000 --concurrency 500
+    python bench_load.py --users 1000 --ai-latency 3 --ai-errors 0.1 --tmdb-errors 0.05 --telegram-latency 0.05
+    python bench_load.py --users 500 --tracemalloc
+
+Обмеження admission, черги ШІ та ліміти надсилання в Telegram за замовчуванням підняті, щоб міряти
+сам бот; справжні значення можна задати змінними середовища (GLOBAL_GENERATION_RATE, AI_QUEUE_SIZE,
+TELEGRAM_RATE_LIMIT, ...).
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import asyncio
+import argparse
+import tempfile
+import importlib
+import tracemalloc
+import multiprocessing
+from types import SimpleNamespace
+
+import numpy as np
+import aiohttp
+from aiohttp import web
+from telebot import types
+
+GENRES = ["драма", "комедія", "фантастика", "трилер", "жахи", "мелодрама", "детектив", "пригоди", "бойовик", "аніме"]
+FAVORITES = ["⏭️ Пропустити", "Інтерстеллар", "Початок, Матриця", "Друзі", "Хрещений батько, Леон"]
+PREFERENCES = ["⏭️ Пропустити", "несподівана кінцівка", "гарна музика", "космос", "сильні персонажі"]
+STEPS = ["start", "new_search", "genre", "favorites", "preferences", "film"]
+
+
+class Profile:
+    """Поведінка заглушки: середня затримка, розкид і частка відповідей з помилкою"""
+
+    def __init__(self, latency=0.0, jitter=0.0, errors=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.errors = errors
+
+    async def wait(self):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def fails(self):
+        return random.random() < self.errors
+
+
+class Stubs:
+    """Bot API, TMDB і OpenAI-сумісний чат на одному порту"""
+
+    def __init__(self, telegram, tmdb, ai, films=500):
+        self.telegram = telegram
+        self.tmdb = tmdb
+        self.ai = ai
+        self.films = [f"Фільм {i} ({1970 + i % 55})" for i in range(films)]
+        self.message_id = 0
+
+    async def handle_telegram(self, request):
+        data = await request.post()
+        await self.telegram.wait()
+        if self.telegram.fails():
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        method = request.match_info["method"]
+        if not (method.startswith("send") or method.startswith("edit")):
+            return web.json_response({"ok": True, "result": True})
+        self.message_id += 1
+        result = {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+            "text": data.get("text") or data.get("caption") or "",
+        }
+        if method == "sendPhoto":
+            # як Telegram: фото за URL отримує file_id, за яким його можна надіслати знову
+            photo = data.get("photo", "")
+            file_id = f"photo-{zlib.crc32(photo.encode())}" if photo.startswith("http") else photo
+            result["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 500, "height": 750}]
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_search(self, request):
+        await self.tmdb.wait()
+        if self.tmdb.fails():
+            return web.Response(status=503)
+        query = request.query.get("query", "")
+        return web.json_response({"results": [{"id": zlib.crc32(query.encode()) % 1000000 + 1, "title": query}]})
+
+    async def handle_movie(self, request):
+        await self.tmdb.wait()
+        if self.tmdb.fails():
+            return web.Response(status=503)
+        movie_id = int(request.match_info["movie_id"])
+        return web.json_response({
+            "id": movie_id,
+            "title": f"Фільм {movie_id}",
+            "original_title": f"Film {movie_id}",
+            "release_date": f"{1970 + movie_id % 55}-01-01",
+            "vote_average": round(5 + movie_id % 50 / 10, 1),
+            "overview": "Опис фільму. " * 20,
+            "genres": [{"id": 18, "name": random.choice(GENRES)}],
+            "poster_path": f"/{movie_id}.jpg",
+        })
+
+    def answer(self, prompt, model):
+        # той самий запит до тієї самої моделі — та сама відповідь, як у справжнього кешованого чату
+        rng = random.Random(zlib.crc32(f"{model}:{prompt}".encode()))
+        return [f"{i}) {film}" for i, film in enumerate(rng.sample(self.films, 5), 1)]
+
+    async def handle_chat(self, request):
+        body = await request.json()
+        lines = self.answer(body["messages"][-1]["content"], body.get("model"))
+        if self.ai.fails():
+            await self.ai.wait()
+            return web.Response(status=500)
+        if not body.get("stream"):
+            await self.ai.wait()
+            message = {"role": "assistant", "content": "\n".join(lines)}
+            return web.json_response({"choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        # затримка розподіляється між рядками: перший фільм з'являється раніше за останній
+        share = Profile(self.ai.latency / len(lines), self.ai.jitter / len(lines))
+        for i, line in enumerate(lines):
+            await share.wait()
+            chunk = {"choices": [{"index": 0, "delta": {"content": line + ("\n" if i < len(lines) - 1 else "")}}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle_telegram)
+        app.router.add_get("/3/search/movie", self.handle_search)
+        app.router.add_get("/3/movie/{movie_id}", self.handle_movie)
+        app.router.add_post("/v1/chat/completions", self.handle_chat)
+        return app
+
+
+def run_stubs(port, profiles, films, ready):
+    async def serve():
+        runner = web.AppRunner(Stubs(*(Profile(**p) for p in profiles), films=films).app(), access_log=None)
+        await runner.setup()
+        # кілька процесів заглушок ділять один порт
+        await web.TCPSite(runner, "127.0.0.1", port, reuse_port=True).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def _namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+
+class StubAIClient:
+    """Замість g4f.client.AsyncClient: той самий chat.completions.create(), але запити йдуть на заглушку"""
+
+    def __init__(self, url):
+        self.url = url
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        return self._session
+
+    def create(self, messages, model, stream=False, **kwargs):
+        body = {"model": model, "messages": messages, "stream": stream}
+        return self._stream(body) if stream else self._complete(body)
+
+    async def _complete(self, body):
+        async with self._get_session().post(self.url, json=body) as response:
+            response.raise_for_status()
+            return _namespace(await response.json())
+
+    async def _stream(self, body):
+        async with self._get_session().post(self.url, json=body) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                line = line.strip()
+                if line.startswith(b"data: ") and line != b"data: [DONE]":
+                    yield _namespace(json.loads(line[6:]))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+def rss():
+    """Поточний RSS процесу в байтах (Linux) або пік RSS, якщо /proc недоступний"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ErrorCounter:
+    """exception_handler бота: рахує винятки обробників замість друку кожного в лог"""
+
+    def __init__(self):
+        self.errors = {}
+
+    def handle(self, exception):
+        name = type(exception).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+        return True
+
+
+def make_update(update_id, chat_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "bench"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return types.Update.de_json({"update_id": update_id, "message": message})
+
+
+async def run_user(bot_module, chat_id, think, timings, outcome):
+    rng = random.Random(chat_id)
+    texts = ["/start", "🔍 Новий підбір фільмів", rng.choice(GENRES), rng.choice(FAVORITES), rng.choice(PREFERENCES)]
+    for step, text in enumerate(texts + [None]):
+        if text is None:
+            # останній крок — картка першого фільму з клавіатури рекомендацій
+            session = await bot_module.sessions.get(chat_id)
+            if not session.recommendations:
+                return
+            outcome["recommended"] += 1
+            text = session.recommendations[0]
+        if think:
+            await asyncio.sleep(rng.uniform(0, think))
+        update = make_update(chat_id * 10 + step, chat_id, text)
+        start = time.perf_counter()
+        await bot_module.bot.process_new_updates([update])
+        timings[STEPS[step]].append(time.perf_counter() - start)
+
+
+async def sample_memory(samples, interval=0.5):
+    while True:
+        samples.append(rss())
+        await asyncio.sleep(interval)
+
+
+def print_latency(timings):
+    print(f"{'step':>12} {'count':>7} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9} {'max, ms':>9}")
+    rows = [(step, timings[step]) for step in STEPS] + [("all", [t for step in STEPS for t in timings[step]])]
+    for step, values in rows:
+        if not values:
+            continue
+        values = np.array(values) * 1000
+        print(f"{step:>12} {len(values):>7} {np.percentile(values, 50):>9.1f} {np.percentile(values, 95):>9.1f} "
+              f"{np.percentile(values, 99):>9.1f} {values.max():>9.1f}")
+
+
+def calls(registry, name, label):
+    return {entry["labels"][label]: entry["count"] for entry in registry.summary().get(name, [])}
+
+
+async def drive(args):
+    bot_module = importlib.import_module(args.module)
+    bot_module.init_db()
+    ai_client = StubAIClient(f"http://127.0.0.1:{args.port}/v1/chat/completions")
+    bot_module.ai_backends.client = ai_client
+    errors = ErrorCounter()
+    bot_module.bot.exception_handler = errors
+    await bot_module.startup()
+
+    timings = {step: [] for step in STEPS}
+    outcome = {"recommended": 0}
+    memory = []
+    sampler = asyncio.create_task(sample_memory(memory))
+    if args.tracemalloc:
+        tracemalloc.start()
+        snapshot = tracemalloc.take_snapshot()
+    rss_start = rss()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user(chat_id):
+        async with semaphore:
+            await run_user(bot_module, chat_id, args.think, timings, outcome)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(args.first_chat + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - start
+    rss_end = rss()
+    sampler.cancel()
+
+    updates = sum(len(values) for values in timings.values())
+    print(f"users:        {args.users} (at most {args.concurrency} at once)")
+    print(f"updates:      {updates} in {elapsed:.2f}s ({updates / elapsed:.0f}/s)")
+    print(f"recommended:  {outcome['recommended']}/{args.users} users got films")
+    print(f"errors:       {errors.errors or 'none'}")
+    print_latency(timings)
+
+    registry = bot_module.metrics.REGISTRY
+    print(f"bot API:      {calls(registry, 'telegram_request_seconds', 'method')}")
+    print(f"TMDB:         {calls(registry, 'tmdb_request_seconds', 'endpoint')}")
+    ai_requests = sum(entry["count"] for entry in registry.summary().get("llm_request_seconds", []))
+    print(f"AI:           {ai_requests} requests, {bot_module.ai_flight.stats()['shared']} shared with identical ones")
+    print(f"rejected:     {calls(registry, 'generations_rejected_total', 'reason') or 'none'}")
+    print(f"posters:      {bot_module.posters.stats()}")
+    mb = 1024 * 1024
+    print(f"memory:       RSS {rss_start / mb:.1f} MB -> {rss_end / mb:.1f} MB (peak {max(memory + [rss_end]) / mb:.1f} MB), "
+          f"{(rss_end - rss_start) / args.users / 1024:+.1f} KB/user")
+    if args.tracemalloc:
+        print("top allocations since start:")
+        for stat in tracemalloc.take_snapshot().compare_to(snapshot, "lineno")[:10]:
+            print(f"  {stat}")
+        tracemalloc.stop()
+
+    await bot_module.close_resources()
+    await ai_client.close()
+    await bot_module.bot.close_session()
+
+
+def main(args):
+    profiles = [
+        {"latency": args.telegram_latency, "jitter": args.telegram_jitter, "errors": args.telegram_errors},
+        {"latency": args.tmdb_latency, "jitter": args.tmdb_jitter, "errors": args.tmdb_errors},
+        {"latency": args.ai_latency, "jitter": args.ai_jitter, "errors": args.ai_errors},
+    ]
+    context = multiprocessing.get_context("spawn")
+    stubs = []
+    for _ in range(args.stub_processes):
+        ready = context.Event()
+        process = context.Process(target=run_stubs, args=(args.port, profiles, args.films, ready), daemon=True)
+        process.start()
+        stubs.append(process)
+        ready.wait()
+
+    # бот пише базу в тимчасову папку, а ходить лише на заглушки
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix="bench_load_"))
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{args.port}",
+        "TMDB_API_KEY": "bench",
+        "TMDB_API_URL": f"http://127.0.0.1:{args.port}/3",
+        "GENERATION_MODE": "inline",
+        "METRICS_PORT": "0",
+    })
+    for name, value in {"GLOBAL_GENERATION_RATE": "1000000", "GLOBAL_GENERATION_BURST": "1000000",
+                        "AI_QUEUE_SIZE": "1000000", "TELEGRAM_RATE_LIMIT": "1000000", "TELEGRAM_CHAT_RATE": "1000",
+                        "TELEGRAM_CHAT_BURST": "1000", "LOG_CONSOLE": "0"}.items():
+        os.environ.setdefault(name, value)
+    try:
+        asyncio.run(drive(args))
+    finally:
+        for process in stubs:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="модуль бота: main або debug")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=500, help="скільки користувачів ведуть діалог одночасно")
+    parser.add_argument("--think", type=float, default=0, help="пауза користувача між повідомленнями, до N секунд")
+    parser.add_argument("--first-chat", type=int, default=100000)
+    parser.add_argument("--films", type=int, default=500, help="скільки різних фільмів називає заглушка ШІ")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--stub-processes", type=int, default=1)
+    parser.add_argument("--tracemalloc", action="store_true", help="показати, де виділялась пам'ять (повільніше)")
+    for backend, latency in (("telegram", 0.03), ("tmdb", 0.05), ("ai", 2.0)):
+        parser.add_argument(f"--{backend}-latency", type=float, default=latency, help="середня затримка, с")
+        parser.add_argument(f"--{backend}-jitter", type=float, default=latency / 2, help="розкид затримки, +/- с")
+        parser.add_argument(f"--{backend}-errors", type=float, default=0.0, help="частка відповідей з помилкою")
+    main(parser.parse_args())
@@ -0,0 +1,88 @@
+"""Скільки коштує один виклик logger.info() для обробника бота.
+
+Порівнює старий синхронний FileHandler (запис на диск у потоці виклику) з чергою logs.setup_logging
+(виклик лише кладе запис у чергу, JSON і диск — у потоці QueueListener), а також з вибіркою подій
+і лімітом записів на секунду. З --stall-ms кожен --stall-every-й запис на диск "зависає" на вказаний
+час, як на перевантаженому диску: синхронний обробник чекає на нього, черга — ні.
+
+    python bench_logging.py --records 50000
+    python bench_logging.py --records 20000 --stall-ms 20 --stall-every 1000
+"""
+import os
+import time
+import logging
+import argparse
+import tempfile
+import itertools
+
+import numpy as np
+
+from logs import setup_logging
+
+
+def measure(logger, records):
+    timings = np.empty(records)
+    for i in range(records):
+        start = time.perf_counter()
+        logger.info("USER ACTION | UserID: %s | Action: %s", i, "Genre selected", extra={"event": "user_action", "user_id": i})
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def stall(handlers, delay, every):
+    """Імітує повільний диск: кожен every-й запис обробника затримується на delay секунд"""
+    for handler in handlers:
+        if isinstance(handler, logging.FileHandler):
+            emit, counter = handler.emit, itertools.count(1)
+
+            def slow_emit(record, emit=emit, counter=counter):
+                if next(counter) % every == 0:
+                    time.sleep(delay)
+                emit(record)
+
+            handler.emit = slow_emit
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+
+def main(args):
+    path = os.path.join(tempfile.mkdtemp(), "bench.log")
+    logger = logging.getLogger("bench")
+    setups = {
+        "sync FileHandler": None,
+        "queue + JSON": {},
+        "queue, sample 10%": {"sample": {"user_action": 0.1}},
+        "queue, cap 1000/s": {"caps": {logging.INFO: 1000}},
+    }
+    print(f"{'logging':>20} {'p50, us':>9} {'p99, us':>9} {'max, us':>9} {'total, s':>9}")
+    for name, options in setups.items():
+        reset_root()
+        listener = None
+        if options is None:
+            logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                                handlers=[logging.FileHandler(path)])
+        else:
+            listener = setup_logging(path, console=False, queue_size=args.records, **options)
+        if args.stall_ms:
+            stall(listener.handlers if listener else logging.getLogger().handlers, args.stall_ms / 1000, args.stall_every)
+        start = time.perf_counter()
+        timings = measure(logger, args.records) * 1e6
+        if listener is not None:
+            listener.stop()
+        total = time.perf_counter() - start
+        print(f"{name:>20} {np.percentile(timings, 50):>9.1f} {np.percentile(timings, 99):>9.1f} "
+              f"{timings.max():>9.0f} {total:>9.2f}")
+    reset_root()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--stall-ms", type=float, default=0, help="затримка \"повільного\" запису на диск")
+    parser.add_argument("--stall-every", type=int, default=1000)
+    main(parser.parse_args())
@@ -0,0 +1,116 @@
+"""Точність і швидкість розбору списків фільмів з відповідей ШІ.
+
+Порівнює parse_films зі старим розбором (clean_ai_text + фільтр рядків "N)" у підборі та "перші
+п'ять непорожніх рядків" у пошуку схожих) на корпусі parsing_corpus.json, а потім фазить корпус:
+змінює маркери, додає markdown, посилання, преамбули, зливає рядки — і перевіряє, що розбір не
+падає і дає той самий результат.
+
+    python bench_parsing.py --iterations 2000 --fuzz 5000
+"""
+import re
+import json
+import time
+import random
+import argparse
+
+from parsing import parse_films
+
+
+def clean_ai_text(content):
+    content = re.sub(r'https?://\S+|www\.\S+|\S+\.(com|org|net|ua|ru|info|tv|ly|to|gg|ai)\b', '', content, flags=re.IGNORECASE)
+    content = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', content)
+    return content.replace("*", "").strip()
+
+
+def old_recommendation_parser(text):
+    films = [line.strip().replace("*", "") for line in clean_ai_text(text).split('\n') if re.match(r"^\d+\)", line.strip())][:5]
+    return [re.sub(r"^\d+\)\s*", "", film) for film in films]
+
+
+def old_similar_parser(text):
+    return [line.strip().replace("*", "") for line in clean_ai_text(text).split('\n') if line.strip()][:5]
+
+
+def new_parser(text):
+    return [str(film) for film in parse_films(text)]
+
+
+def expected_strings(case):
+    return [f"{title} ({year})" if year else title for title, year in case["expected"]]
+
+
+MUTATIONS = [
+    lambda text: re.sub(r"^(\d+)\)", r"\1.", text, flags=re.MULTILINE),
+    lambda text: re.sub(r"^\d+[.)]", "-", text, flags=re.MULTILINE),
+    lambda text: re.sub(r"^(\d+[.)]) ([^(\n]+?) \(", r"\1 **\2** (", text, flags=re.MULTILINE),
+    lambda text: re.sub(r"\)$", ") — чудовий фільм, варто подивитися.", text, flags=re.MULTILINE),
+    lambda text: "Ось що я знайшов:\n\n" + text,
+    lambda text: text + "\n\nДжерело: https://www.themoviedb.org/movie",
+    lambda text: text.replace("\n", "; ") if text.startswith("1)") else text,
+    lambda text: text.replace("\n", "\r\n"),
+    lambda text: text.replace("\n", "\n\n"),
+    lambda text: "  " + text.replace("\n", "\n  "),
+]
+
+
+def fuzz(corpus, rounds, seed=0):
+    rng = random.Random(seed)
+    failures, unchanged = [], 0
+    for _ in range(rounds):
+        case = rng.choice(corpus)
+        text = case["text"]
+        for mutation in rng.sample(MUTATIONS, rng.randint(1, 3)):
+            text = mutation(text)
+        try:
+            result = [film.title for film in parse_films(text)]
+        except Exception as e:
+            failures.append((text, repr(e)))
+            continue
+        unchanged += result == [title for title, _ in case["expected"]]
+    return unchanged, failures
+
+
+def main(args):
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    print(f"{'parser':>22} {'exact':>7} {'items':>7} {'us/response':>12}")
+    for name, parser in (
+        ("old recommendation", old_recommendation_parser),
+        ("old similar", old_similar_parser),
+        ("parse_films", new_parser),
+    ):
+        exact = found = total = 0
+        for case in corpus:
+            expected = expected_strings(case)
+            result = parser(case["text"])
+            exact += result == expected
+            found += len(set(result) & set(expected))
+            total += len(expected)
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            for case in corpus:
+                parser(case["text"])
+        elapsed = (time.perf_counter() - start) / (args.iterations * len(corpus)) * 1e6
+        print(f"{name:>22} {exact:>3}/{len(corpus):<3} {found / total:>7.0%} {elapsed:>12.1f}")
+
+    if args.verbose:
+        for case in corpus:
+            result = new_parser(case["text"])
+            if result != expected_strings(case):
+                print(f"\n{case['format']}: {result}")
+
+    unchanged, failures = fuzz(corpus, args.fuzz)
+    print(f"\nfuzz: {args.fuzz} mutated responses, {len(failures)} exceptions, "
+          f"{unchanged / args.fuzz:.0%} parsed to the same titles as expected")
+    for text, error in failures[:5]:
+        print(error, repr(text[:200]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="parsing_corpus.json")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--fuzz", type=int, default=2000)
+    parser.add_argument("-v", "--verbose", action="store_true", help="показати відповіді, які parse_films розібрав не так")
+    main(parser.parse_args())
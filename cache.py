@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+import storage
+
+_MISSING = object()
+
+LLM_CACHE_LOOKUPS = metrics.counter("llm_cache_lookups_total", "AI response cache lookups by result", ["result"])
+
+
+class TTLCache:
+    """LRU-кеш обмеженого розміру, де кожен запис має час життя"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.lower().split())
+
+
+class PromptCache:
+    """Кеш відповідей ШІ за нормалізованим промптом: LRU у пам'яті та необов'язковий рівень у SQLite,
+    який переживає перезапуск бота"""
+
+    def __init__(self, maxsize=1000, ttl=86400, persistent=False):
+        self.ttl = ttl
+        self.persistent = persistent
+        self.memory = TTLCache(maxsize, ttl)
+
+    @staticmethod
+    def key(prompt):
+        return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+    async def get(self, prompt):
+        key = self.key(prompt)
+        response = self.memory.get(key)
+        result = "memory"
+        if response is None and self.persistent:
+            row = await asyncio.to_thread(storage.get_cached_response, key)
+            if row:
+                response, expires_at = row
+                self.memory.set(key, response, ttl=expires_at - time.time())
+                result = "sqlite"
+        LLM_CACHE_LOOKUPS.inc(result=result if response is not None else "miss")
+        return response
+
+    async def set(self, prompt, response):
+        key = self.key(prompt)
+        self.memory.set(key, response)
+        if self.persistent:
+            await asyncio.to_thread(storage.save_cached_response, key, response, int(time.time() + self.ttl))
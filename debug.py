@@ -1,96 +1,218 @@
 import os
+import json
 import re
-import requests
-import sqlite3
-import telebot
-from telebot import types
+import asyncio
+from telebot import types, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware
 from dotenv import load_dotenv
-from g4f.client import Client
-import threading
+from g4f.client import AsyncClient
 import time
+from storage import (init_db, save_recommendations, get_user_recommendations, clear_user_recommendations,
+                     save_film_vector, get_film_vectors)
+from ai_pool import AIWorkerPool, PoolBusy
+from cache import PromptCache
+from tmdb import TMDBClient, Prefetcher, clean_film_title
+from streaming import StreamingMessage
+from providers import ProviderRegistry, parse_backends
+from sessions import Session, create_session_store
+from router import Router
+from similarity import SimilarityIndex, film_from_record, format_film
+from titles import TitleIndex
+from parsing import parse_films, parse_line, has_films, format_films
+from singleflight import SingleFlight
+from ratelimit import AdmissionControl, Rejected, SharedTokenBucket
+from jobs import JobQueue
+from outbox import Outbox
+from posters import PosterCache
+import metrics
+from logs import setup_logging, parse_levels, parse_rates
 import logging
-import datetime
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot_logs.log'),
-        logging.StreamHandler()
-    ]
-)
+import atexit
+
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+TELEGRAM_MAX_CONNECTIONS = int(os.getenv("TELEGRAM_MAX_CONNECTIONS", "50"))
+TELEGRAM_RATE_LIMIT = float(os.getenv("TELEGRAM_RATE_LIMIT", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-
-bot = telebot.TeleBot(TELEGRAM_TOKEN)
-client = Client()
-user_data = {}
-
-DB_FILE = "user_films.db"
+TMDB_READ_TOKEN = os.getenv("TMDB_READ_TOKEN")
+TMDB_API_URL = os.getenv("TMDB_API_URL")
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "100"))
+AI_WORKERS = int(os.getenv("AI_WORKERS", "8"))
+AI_QUEUE_SIZE = int(os.getenv("AI_QUEUE_SIZE", "50"))
+AI_STREAMING = os.getenv("AI_STREAMING", "1") == "1"
+AI_BACKENDS = os.getenv("AI_BACKENDS", "gpt-4,gpt-4o-mini")
+AI_HEDGE = int(os.getenv("AI_HEDGE", "2"))
+AI_HEDGE_DELAY = float(os.getenv("AI_HEDGE_DELAY", "4"))
+AI_REASK_TIMEOUT = int(os.getenv("AI_REASK_TIMEOUT", "15"))
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1000"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_PERSISTENT = os.getenv("LLM_CACHE_PERSISTENT", "1") == "1"
+TMDB_CACHE_SIZE = int(os.getenv("TMDB_CACHE_SIZE", "2000"))
+TMDB_CACHE_TTL = int(os.getenv("TMDB_CACHE_TTL", "86400"))
+TMDB_MAX_CONNECTIONS = int(os.getenv("TMDB_MAX_CONNECTIONS", "20"))
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", "40"))
+TMDB_PREFETCH_CONCURRENCY = int(os.getenv("TMDB_PREFETCH_CONCURRENCY", "10"))
+POSTER_CACHE_SIZE = int(os.getenv("POSTER_CACHE_SIZE", "10000"))
+POSTER_SIZE = os.getenv("POSTER_SIZE", "w500")
+TITLE_MATCH_THRESHOLD = float(os.getenv("TITLE_MATCH_THRESHOLD", "0.8"))
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite")
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 86400)))
+SIMILARITY_INDEX = os.getenv("SIMILARITY_INDEX")
+SIMILARITY_RERANK = os.getenv("SIMILARITY_RERANK", "0") == "1"
+SIMILARITY_CANDIDATES = int(os.getenv("SIMILARITY_CANDIDATES", "15"))
+SIMILARITY_NPROBE = int(os.getenv("SIMILARITY_NPROBE", "32"))
+USER_GENERATION_RATE = float(os.getenv("USER_GENERATION_RATE", "6"))
+USER_GENERATION_BURST = int(os.getenv("USER_GENERATION_BURST", "3"))
+GLOBAL_GENERATION_RATE = float(os.getenv("GLOBAL_GENERATION_RATE", "60"))
+GLOBAL_GENERATION_BURST = int(os.getenv("GLOBAL_GENERATION_BURST", "20"))
+GENERATION_MODE = os.getenv("GENERATION_MODE", "inline")
+JOB_LEASE = int(os.getenv("JOB_LEASE", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+LOG_FILE = os.getenv("LOG_FILE", "bot_logs.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN")
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "DEBUG=200,INFO=200,WARNING=50")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "1") == "1"
+
+# запис у файл іде в окремому потоці, обробники лише кладуть записи в чергу
+log_listener = setup_logging(
+    LOG_FILE.format(pid=os.getpid()),
+    level=LOG_LEVEL.upper(),
+    max_bytes=LOG_MAX_BYTES,
+    backups=LOG_BACKUPS,
+    rotate_when=LOG_ROTATE_WHEN,
+    sample=parse_rates(LOG_SAMPLE),
+    caps=parse_levels(LOG_RATE_LIMITS),
+    queue_size=LOG_QUEUE_SIZE,
+    console=LOG_CONSOLE
+)
+atexit.register(log_listener.stop)
+
+if GENERATION_MODE not in ("inline", "queue"):
+    raise ValueError(f"Unknown generation mode: {GENERATION_MODE}")
+if GENERATION_MODE == "queue" and SESSION_STORE != "sqlite":
+    # воркери черги читають сесії з іншого процесу
+    raise ValueError("GENERATION_MODE=queue requires SESSION_STORE=sqlite")
+
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+asyncio_helper.REQUEST_LIMIT = TELEGRAM_MAX_CONNECTIONS
+
+bot = AsyncTeleBot(TELEGRAM_TOKEN)
+client = AsyncClient()
+ai_backends = ProviderRegistry(client, parse_backends(AI_BACKENDS), hedge=AI_HEDGE, hedge_delay=AI_HEDGE_DELAY)
+ai_pool = AIWorkerPool(AI_WORKERS, AI_QUEUE_SIZE)
+llm_cache = PromptCache(LLM_CACHE_SIZE, LLM_CACHE_TTL, persistent=LLM_CACHE_PERSISTENT)
+ai_flight = SingleFlight()
+titles = TitleIndex(TITLE_MATCH_THRESHOLD, persistent=True)
+similarity = SimilarityIndex.load(SIMILARITY_INDEX, SIMILARITY_NPROBE) if SIMILARITY_INDEX else None
+
+async def remember_film(details):
+    """Додає фільм, знайдений на TMDB, у дельта-сегмент індексу схожості"""
+    if similarity is None or details["id"] in similarity:
+        return
+    vector = similarity.add(film_from_record(details))
+    if vector is None:
+        return
+    await asyncio.to_thread(save_film_vector, details["id"], json.dumps(similarity.delta_films[-1], ensure_ascii=False), vector.tobytes())
+
+tmdb = TMDBClient(
+    TMDB_API_KEY,
+    cache_size=TMDB_CACHE_SIZE,
+    ttl=TMDB_CACHE_TTL,
+    max_connections=TMDB_MAX_CONNECTIONS,
+    rate_limit=TMDB_RATE_LIMIT,
+    titles=titles,
+    api_url=TMDB_API_URL,
+    read_token=TMDB_READ_TOKEN,
+    on_details=remember_film
+)
+sessions = create_session_store(SESSION_STORE, cache_size=SESSION_CACHE_SIZE, ttl=SESSION_TTL)
+router = Router()
+admission = AdmissionControl(USER_GENERATION_RATE, USER_GENERATION_BURST, GLOBAL_GENERATION_RATE, GLOBAL_GENERATION_BURST)
+jobs = JobQueue(JOB_LEASE, JOB_MAX_ATTEMPTS)
+# загальний ліміт Telegram діє на бота, тож його ділять усі процеси: воркери webhook і job_worker.py
+outbox = Outbox(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST,
+                global_bucket=SharedTokenBucket("telegram", TELEGRAM_RATE_LIMIT))
+posters = PosterCache(POSTER_CACHE_SIZE, size=POSTER_SIZE)
+prefetcher = Prefetcher(tmdb, TMDB_PREFETCH_CONCURRENCY)
+
+LLM_LATENCY = metrics.histogram("llm_request_seconds", "Time of one AI request including the wait for a free AI worker")
+GENERATION_LATENCY = metrics.histogram("generation_seconds", "Time to get a film list for a search", ["kind", "source"])
+TELEGRAM_LATENCY = metrics.histogram("telegram_request_seconds", "Time of one Bot API call", ["method"])
+TELEGRAM_IN_FLIGHT = metrics.gauge("telegram_requests_in_flight", "Bot API calls in progress")
+UPDATES_IN_FLIGHT = metrics.gauge("updates_in_flight", "Telegram updates being handled")
+GENERATIONS_IN_FLIGHT = metrics.gauge("generations_in_flight", "Film searches in progress", ["kind"])
+TIMEOUTS = metrics.counter("timeouts_total", "Timed out requests by stage", ["stage"])
+PARSE_FAILURES = metrics.counter("parse_failures_total", "AI answers without a film list", ["kind"])
+REJECTED = metrics.counter("generations_rejected_total", "Film searches not admitted, by reason", ["reason"])
+metrics.gauge("llm_requests_in_flight", "AI requests running in the AI worker pool", fn=lambda: ai_pool.busy)
+metrics.gauge("llm_queue_length", "AI requests waiting for a free AI worker", fn=lambda: ai_pool.stats()["queue_length"])
+metrics_runner = None
+
+_process_request = asyncio_helper._process_request
+
+async def timed_process_request(token, url, *args, **kwargs):
+    """Заміряє кожен виклик Bot API; url тут — назва методу (sendMessage, editMessageText, ...)"""
+    with TELEGRAM_LATENCY.time(method=url), TELEGRAM_IN_FLIGHT.track():
+        try:
+            return await _process_request(token, url, *args, **kwargs)
+        except asyncio_helper.RequestTimeout:
+            TIMEOUTS.inc(stage="telegram")
+            raise
+
+asyncio_helper._process_request = outbox.wrap(timed_process_request)
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Обмежує кількість оновлень, які обробляються одночасно"""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.update_types = ['message']
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def pre_process(self, message, data):
+        await self.semaphore.acquire()
+        UPDATES_IN_FLIGHT.inc()
+
+    async def post_process(self, message, data, exception):
+        UPDATES_IN_FLIGHT.dec()
+        self.semaphore.release()
+
+bot.setup_middleware(ConcurrencyLimitMiddleware(MAX_CONCURRENT_UPDATES))
 
 def log_user_action(user_id: int, action: str, details: str = ""):
     """Логування дій користувача"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_message = f"USER ACTION | UserID: {user_id} | Action: {action}"
-    if details:
-        log_message += f" | Details: {details}"
-    logger.info(log_message)
+    logger.info(
+        "USER ACTION | UserID: %s | Action: %s%s", user_id, action, f" | Details: {details}" if details else "",
+        extra={"event": "user_action", "user_id": user_id, "action": action}
+    )
 
 def log_ai_request(user_id: int, prompt: str):
     """Логування запитів до ШІ"""
-    logger.info(f"AI REQUEST | UserID: {user_id} | Prompt: {prompt[:200]}...")
+    logger.info("AI REQUEST | UserID: %s | Prompt: %s...", user_id, prompt[:200], extra={"event": "ai_request", "user_id": user_id})
 
 def log_ai_response(user_id: int, response: str):
     """Логування відповідей від ШІ"""
-    logger.info(f"AI RESPONSE | UserID: {user_id} | Response: {response[:200]}...")
+    logger.info("AI RESPONSE | UserID: %s | Response: %s...", user_id, response[:200], extra={"event": "ai_response", "user_id": user_id})
 
 def log_error(user_id: int, error: str, context: str = ""):
     """Логування помилок"""
-    logger.error(f"ERROR | UserID: {user_id} | Error: {error} | Context: {context}")
-
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS recommendations (
-        user_id INTEGER,
-        film TEXT,
-        genre TEXT,
-        preferences TEXT
-    )
-    ''')
-    conn.commit()
-    conn.close()
-    logger.info("Database initialized")
-
-def save_recommendation(user_id, film, genre, preferences):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('INSERT INTO recommendations (user_id, film, genre, preferences) VALUES (?, ?, ?, ?)',
-              (user_id, film, genre, preferences))
-    conn.commit()
-    conn.close()
-    logger.info(f"Recommendation saved for user {user_id}: {film}")
-
-def get_user_recommendations(user_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('SELECT DISTINCT film FROM recommendations WHERE user_id = ?', (user_id,))
-    films = [row[0] for row in c.fetchall()]
-    conn.close()
-    logger.info(f"Retrieved {len(films)} recommendations for user {user_id}")
-    return films
-
-def clear_user_recommendations(user_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('DELETE FROM recommendations WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
-    logger.info(f"Recommendations cleared for user {user_id}")
+    logger.error("ERROR | UserID: %s | Error: %s | Context: %s", user_id, error, context, extra={"event": "error", "user_id": user_id})
 
 def cleanup_nodriver_file():
     try:
@@ -101,19 +223,16 @@ def cleanup_nodriver_file():
     except Exception as e:
         logger.error(f"Failed to delete nodriver file: {str(e)}")
 
-def ask_ai(prompt: str, user_id: int) -> str:
+async def ask_ai(prompt: str, user_id: int, on_line=None) -> str:
     try:
         log_ai_request(user_id, prompt)
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="gpt-4",
-            web_search=False
-        )
-        content = response.choices[0].message.content
-
-        content = re.sub(r'https?://\S+|www\.\S+|\S+\.(com|org|net|ua|ru|info|tv|ly|to|gg|ai)\b', '', content, flags=re.IGNORECASE)
-        content = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', content)
-        content = content.replace("*", "").strip()
+        messages = [{"role": "user", "content": prompt}]
+        if on_line is not None and AI_STREAMING:
+            content = await ai_backends.stream(messages, on_line, validate=has_films, accept=parse_line)
+        else:
+            content = await ai_backends.complete(messages, validate=has_films)
+        if not content:
+            raise RuntimeError(f"no valid answer from AI backends: {ai_backends.stats()}")
 
         log_ai_response(user_id, content)
         return content
@@ -122,20 +241,49 @@ def ask_ai(prompt: str, user_id: int) -> str:
         cleanup_nodriver_file()
         return None
 
-def ask_ai_with_timeout(prompt: str, user_id: int, timeout: int = 30):
-    result = {"response": None}
-
-    def task():
-        result["response"] = ask_ai(prompt, user_id)
-
-    thread = threading.Thread(target=task)
-    thread.start()
-    thread.join(timeout)
-    if thread.is_alive():
+async def ask_ai_with_timeout(prompt: str, user_id: int, timeout: int = 30, on_line=None):
+    async def call():
+        with LLM_LATENCY.time():
+            try:
+                response = await ai_pool.run(lambda: ask_ai(prompt, user_id, on_line), timeout)
+            except asyncio.TimeoutError:
+                TIMEOUTS.inc(stage="llm")
+                raise
+        if response:
+            await llm_cache.set(prompt, response)
+        return response
+
+    # однакові одночасні запити (напр. "схожі на X" від багатьох користувачів) йдуть до ШІ один раз
+    try:
+        return await ai_flight.do(llm_cache.key(prompt), call)
+    except asyncio.TimeoutError:
         logger.warning(f"AI request timeout for user {user_id}")
         cleanup_nodriver_file()
         return None
-    return result["response"]
+
+async def complete_films(prompt, films, user_id, limit=5):
+    """Якщо ШІ назвав менше фільмів, ніж потрібно, дозапитує лише відсутні"""
+    missing = limit - len(films)
+    if missing <= 0:
+        return films
+    follow_up = (
+        f"{prompt} Вже названо: {'; '.join(map(str, films)) or 'нічого'}. "
+        f"Назви ще {missing} інших фільмів. Формат: 1) Назва (рік); 2) Назва (рік); ... Без коментарів."
+    )
+    try:
+        response = await ask_ai_with_timeout(follow_up, user_id, timeout=AI_REASK_TIMEOUT)
+    except PoolBusy:
+        return films
+    seen = {film.title.lower() for film in films}
+    films = films + [film for film in parse_films(response, limit) if film.title.lower() not in seen][:missing]
+    if films:
+        await llm_cache.set(prompt, format_films(films))
+    return films
+
+BUSY_MESSAGE = "⏳ Зараз забагато запитів. Спробуйте ще раз за хвилину:"
+PARSE_ERROR_MESSAGE = "⚠ Не вдалося розібрати відповідь. Спробуйте ще раз:"
+IN_FLIGHT_MESSAGE = "⏳ Я ще шукаю фільми за попереднім запитом, зачекайте трохи."
+USER_RATE_MESSAGE = "⏳ Забагато запитів поспіль. Спробуйте ще раз за {seconds} с:"
 
 def get_retry_markup(is_history=False):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -145,81 +293,187 @@ def get_retry_markup(is_history=False):
         markup.add("🔁 Повторити підбір", "⬅️ Повернутись в головне меню")
     return markup
 
-@bot.message_handler(func=lambda msg: msg.text == "🔁 Повторити підбір")
-def retry_recommendation(message):
+async def delete_placeholder(chat_id, message_id):
+    try:
+        await bot.delete_message(chat_id, message_id)
+    except Exception as e:
+        logger.error(f"Failed to delete message for user {chat_id}: {str(e)}")
+
+async def start_generation(kind, chat_id, **params):
+    """Запускає генерацію kind ("recommendation" або "similar"), якщо її дозволяє admission.
+
+    У режимі GENERATION_MODE=queue генерація лише ставиться в чергу jobs, і обробник одразу
+    повертається, а виконує її job_worker.py.
+    """
+    is_history = kind == "similar"
+    try:
+        admission.acquire(chat_id)
+    except Rejected as e:
+        REJECTED.inc(reason=e.reason)
+        logger.warning(f"Generation rejected for user {chat_id}: {e.reason}, {admission.stats()}")
+        if e.reason == "in_flight":
+            await bot.send_message(chat_id, IN_FLIGHT_MESSAGE)
+        elif e.reason == "user_rate":
+            text = USER_RATE_MESSAGE.format(seconds=int(e.retry_after) + 1)
+            await bot.send_message(chat_id, text, reply_markup=get_retry_markup(is_history))
+        else:
+            await bot.send_message(chat_id, BUSY_MESSAGE, reply_markup=get_retry_markup(is_history))
+        return
+    try:
+        if GENERATION_MODE == "queue":
+            job_id = await jobs.put(kind, chat_id, **params)
+            logger.info(f"Generation queued for user {chat_id}: job {job_id}, {kind}")
+            if job_id is None:
+                await bot.send_message(chat_id, IN_FLIGHT_MESSAGE)
+        else:
+            with GENERATIONS_IN_FLIGHT.track(kind=kind):
+                await GENERATORS[kind](chat_id, **params)
+    finally:
+        admission.release(chat_id)
+
+async def admit_ai(chat_id):
+    """Бере токен загального бюджету ШІ; False, якщо його вичерпано і користувачу треба відповісти BUSY_MESSAGE"""
+    try:
+        await admission.acquire_ai(chat_id)
+    except Rejected as e:
+        REJECTED.inc(reason=e.reason)
+        logger.warning(f"AI request rejected for user {chat_id}: {e.reason}, {admission.stats()}")
+        return False
+    return True
+
+@router.text("🔁 Повторити підбір")
+async def retry_recommendation(message):
     chat_id = message.chat.id
     log_user_action(chat_id, "Retry recommendation")
-    generate_personal_recommendation(chat_id)
+    await start_generation("recommendation", chat_id, fresh=True)
 
-@bot.message_handler(func=lambda msg: msg.text == "🔁 Повторити пошук схожих")
-def retry_history(message):
+@router.text("🔁 Повторити пошук схожих")
+async def retry_history(message):
     chat_id = message.chat.id
-    selected = user_data.get(chat_id, {}).get("last_selected_film")
+    selected = (await sessions.get(chat_id)).last_selected_film
     if not selected:
-        bot.send_message(chat_id, "⚠️ Немає збереженого фільму для повтору.")
+        await bot.send_message(chat_id, "⚠️ Немає збереженого фільму для повтору.")
         return
     log_user_action(chat_id, "Retry similar search", f"Film: {selected}")
-    handle_similar_search(chat_id, selected)
+    await start_generation("similar", chat_id, selected=selected, fresh=True)
 
-def handle_similar_search(chat_id, selected):
-    user_data[chat_id]["last_selected_film"] = selected
+def find_similar_locally(selected, rerank=SIMILARITY_RERANK):
+    """Схожі фільми з локального індексу; порожній список, якщо індексу немає або фільму в ньому немає"""
+    if similarity is None:
+        return []
+    k = SIMILARITY_CANDIDATES if rerank else 5
+    return [format_film(film) for film in similarity.similar(selected, k)]
 
+async def handle_similar_search(chat_id, selected, fresh=False):
     prompt = (
         f"Користувач бачив фільм '{selected}' і хоче щось схоже у цьому ж жанрі або настрої. "
         f"Порекомендуй 5 схожих фільмів. Формат: 1) Назва (рік); 2) Назва (рік); ... Без коментарів."
     )
+    # індекс щоразу дає ті самі п'ять фільмів, тож повторний підбір іде до ШІ з ширшим списком кандидатів
+    rerank = SIMILARITY_RERANK or fresh
+    candidates = find_similar_locally(selected, rerank)
+    if candidates and rerank:
+        prompt = (
+            f"Користувач бачив фільм '{selected}' і хоче щось схоже у цьому ж жанрі або настрої. "
+            f"Обери з цього списку 5 найсхожіших фільмів: {'; '.join(candidates)}. "
+            f"Формат: 1) Назва (рік); 2) Назва (рік); ... Без коментарів."
+        )
 
-    searching_msg = bot.send_message(chat_id, "🔍 Шукаю схожі фільми...", reply_markup=types.ReplyKeyboardRemove())
-    
     start_time = time.time()
-    gpt_response = ask_ai_with_timeout(prompt, chat_id)
+    busy = False
+    source = "cache"
+    if candidates and not rerank:
+        gpt_response = format_films(candidates)
+        source = "local"
+    else:
+        gpt_response = None if fresh else await llm_cache.get(prompt)
+    if gpt_response:
+        logger.info(f"{'Local index' if candidates and not rerank else 'AI cache'} hit for user {chat_id}")
+    else:
+        source = "llm"
+        busy = not await admit_ai(chat_id)
+    if not gpt_response and not busy:
+        searching_msg = await bot.send_message(chat_id, "🔍 Шукаю схожі фільми...", reply_markup=types.ReplyKeyboardRemove())
+        progress = StreamingMessage(bot, chat_id, searching_msg.message_id, "🔍 Шукаю схожі фільми...", STREAM_EDIT_INTERVAL)
+
+        def on_line(line):
+            film = parse_line(line)
+            if film and len(progress.lines) < 5:
+                progress.add(f"{len(progress.lines) + 1}) {film}")
+
+        try:
+            gpt_response = await ask_ai_with_timeout(prompt, chat_id, on_line=on_line)
+        except PoolBusy:
+            busy = True
+        progress.close()
+        # заглушка видаляється у фоні: відповідь не чекає на цей виклик
+        outbox.later(delete_placeholder(chat_id, searching_msg.message_id))
+    if not gpt_response and candidates:
+        logger.warning(f"AI rerank failed for user {chat_id}, using local order")
+        # повтор без ШІ показує наступні кандидати, а не ті самі п'ять
+        gpt_response = format_films((fresh and candidates[5:10]) or candidates[:5])
+        busy = False
     elapsed_time = time.time() - start_time
+    GENERATION_LATENCY.observe(elapsed_time, kind="similar", source=source)
 
-    try:
-        bot.delete_message(chat_id, searching_msg.message_id)
-    except Exception as e:
-        logger.error(f"Failed to delete message for user {chat_id}: {str(e)}")
+    if busy:
+        logger.warning(f"AI pool busy for user {chat_id}: {ai_pool.stats()}")
+        await bot.send_message(chat_id, BUSY_MESSAGE, reply_markup=get_retry_markup(is_history=True))
+        return
 
     if not gpt_response:
-        bot.send_message(chat_id, "⚠ Час очікування вичерпано. Спробуйте ще раз:", reply_markup=get_retry_markup(is_history=True))
+        await bot.send_message(chat_id, "⚠ Час очікування вичерпано. Спробуйте ще раз:", reply_markup=get_retry_markup(is_history=True))
+        return
+
+    films = parse_films(gpt_response)
+    if source == "llm":
+        # відповідь з кешу вже дозапитувалася, коли потрапила туди, а з локального індексу — повна
+        films = await complete_films(prompt, films, chat_id)
+    if not films:
+        PARSE_FAILURES.inc(kind="similar")
+        await bot.send_message(chat_id, PARSE_ERROR_MESSAGE, reply_markup=get_retry_markup(is_history=True))
         return
 
-    films = [line.strip().replace("*", "") for line in gpt_response.split('\n') if line.strip()][:5]
+    films = [str(film) for film in films]
+    # у режимі queue це процес job_worker.py: його кеш TMDB не допоможе боту, який покаже картку фільму
+    if GENERATION_MODE != "queue":
+        prefetcher.prefetch(chat_id, films)
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     for film in films:
         markup.add(film)
     markup.add("⬅️ Повернутись в головне меню")
 
-    bot.send_message(chat_id, "\n".join(films), reply_markup=markup)
-    user_data[chat_id]['recommendations'] = films
-    user_data[chat_id]['step'] = 'done'
+    await bot.send_message(chat_id, format_films(films), reply_markup=markup)
+    await sessions.update(chat_id, recommendations=films, step='done')
     logger.info(f"Similar films found for user {chat_id}: {films}")
 
-@bot.message_handler(func=lambda msg: user_data.get(msg.chat.id, {}).get('step') == 'similar' and msg.text != "🗑 Очистити історію")
-def handle_similar_film(message):
+@router.step('similar')
+async def handle_similar_film(message):
     chat_id = message.chat.id
     selected = message.text.strip()
     log_user_action(chat_id, "Selected film from history", selected)
 
     if selected == "⬅️ Повернутись в головне меню":
-        send_welcome(message)
+        await send_welcome(message)
         return
 
-    handle_similar_search(chat_id, selected)
+    await sessions.update(chat_id, last_selected_film=selected)
+    await start_generation("similar", chat_id, selected=selected)
 
-@bot.message_handler(func=lambda msg: msg.text == "🗑 Очистити історію")
-def clear_history(message):
+@router.text("🗑 Очистити історію")
+async def clear_history(message):
     chat_id = message.chat.id
     log_user_action(chat_id, "Clear history")
-    clear_user_recommendations(chat_id)
-    bot.send_message(chat_id, "✅ Історію очищено. Натисни ⬅️ щоб повернутись.")
-    user_data[chat_id]['step'] = 'history_cleared'
-
-def generate_personal_recommendation(chat_id):
-    data = user_data[chat_id]
-    genre = data['genre']
-    favorites = ", ".join(data['favorites'])
-    preferences = data['preferences']
+    await asyncio.to_thread(clear_user_recommendations, chat_id)
+    logger.info(f"Recommendations cleared for user {chat_id}")
+    await bot.send_message(chat_id, "✅ Історію очищено. Натисни ⬅️ щоб повернутись.")
+    await sessions.update(chat_id, step='history_cleared')
+
+async def generate_personal_recommendation(chat_id, fresh=False):
+    session = await sessions.get(chat_id)
+    genre = session.genre
+    favorites = ", ".join(session.favorites)
+    preferences = session.preferences
     log_user_action(chat_id, "Generate recommendation", f"Genre: {genre}, Favorites: {favorites}, Preferences: {preferences}")
 
     prompt = (
@@ -229,39 +483,94 @@ def generate_personal_recommendation(chat_id):
         f"Формат: 1) Назва (рік); 2) Назва (рік); ... Без коментарів."
     )
 
-    searching_msg = bot.send_message(chat_id, "⏳ Шукаю найкращі варіанти для вас...", reply_markup=types.ReplyKeyboardRemove())
-    
     start_time = time.time()
-    gpt_response = ask_ai_with_timeout(prompt, chat_id)
+    busy = False
+    source = "cache"
+    gpt_response = None if fresh else await llm_cache.get(prompt)
+    if gpt_response:
+        logger.info(f"AI cache hit for user {chat_id}")
+    else:
+        source = "llm"
+        busy = not await admit_ai(chat_id)
+    if not gpt_response and not busy:
+        searching_msg = await bot.send_message(chat_id, "⏳ Шукаю найкращі варіанти для вас...", reply_markup=types.ReplyKeyboardRemove())
+        progress = StreamingMessage(bot, chat_id, searching_msg.message_id, "⏳ Шукаю найкращі варіанти для вас...", STREAM_EDIT_INTERVAL)
+
+        def on_line(line):
+            film = parse_line(line)
+            if film and len(progress.lines) < 5:
+                progress.add(f"{len(progress.lines) + 1}) {film}")
+
+        try:
+            gpt_response = await ask_ai_with_timeout(prompt, chat_id, on_line=on_line)
+        except PoolBusy:
+            busy = True
+        progress.close()
+        # заглушка видаляється у фоні: відповідь не чекає на цей виклик
+        outbox.later(delete_placeholder(chat_id, searching_msg.message_id))
     elapsed_time = time.time() - start_time
+    GENERATION_LATENCY.observe(elapsed_time, kind="recommendation", source=source)
 
-    try:
-        bot.delete_message(chat_id, searching_msg.message_id)
-    except Exception as e:
-        logger.error(f"Failed to delete message for user {chat_id}: {str(e)}")
+    if busy:
+        logger.warning(f"AI pool busy for user {chat_id}: {ai_pool.stats()}")
+        await bot.send_message(chat_id, BUSY_MESSAGE, reply_markup=get_retry_markup(is_history=False))
+        return
 
     if not gpt_response:
-        bot.send_message(chat_id, "⚠ Час очікування вичерпано. Спробуйте ще раз:", reply_markup=get_retry_markup(is_history=False))
+        await bot.send_message(chat_id, "⚠ Час очікування вичерпано. Спробуйте ще раз:", reply_markup=get_retry_markup(is_history=False))
+        return
+
+    films = parse_films(gpt_response)
+    if source == "llm":
+        # відповідь з кешу вже дозапитувалася, коли потрапила туди, а з локального індексу — повна
+        films = await complete_films(prompt, films, chat_id)
+    if not films:
+        PARSE_FAILURES.inc(kind="recommendation")
+        await bot.send_message(chat_id, PARSE_ERROR_MESSAGE, reply_markup=get_retry_markup(is_history=False))
         return
 
-    films = [line.strip().replace("*", "") for line in gpt_response.split('\n') if re.match(r"^\d+\)", line.strip())][:5]
-    user_data[chat_id]['recommendations'] = films
+    clean_films = [str(film) for film in films]
+    await sessions.update(chat_id, recommendations=clean_films)
+    # у режимі queue це процес job_worker.py: його кеш TMDB не допоможе боту, який покаже картку фільму
+    if GENERATION_MODE != "queue":
+        prefetcher.prefetch(chat_id, clean_films)
+    await asyncio.to_thread(save_recommendations, chat_id, clean_films, genre, preferences)
+    logger.info(f"Recommendations saved for user {chat_id}: {clean_films}")
 
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    for film in films:
-        clean_film = re.sub(r"^\d+\)\s*", "", film)
+    for clean_film in clean_films:
         markup.add(clean_film)
-        save_recommendation(chat_id, clean_film, genre, preferences)
 
     markup.add("⬅️ Повернутись в головне меню")
 
-    bot.send_message(
+    await bot.send_message(
         chat_id,
-        "📽 Ось мої рекомендації для тебе:\n" + "\n".join(films) + "\n\nМожеш обрати фільм, щоб отримати більше інформації:",
+        "📽 Ось мої рекомендації для тебе:\n" + format_films(films) + "\n\nМожеш обрати фільм, щоб отримати більше інформації:",
         reply_markup=markup
     )
     logger.info(f"Recommendations generated for user {chat_id}: {films}")
 
+GENERATORS = {
+    "recommendation": generate_personal_recommendation,
+    "similar": handle_similar_search,
+}
+
+async def run_job(job):
+    """Виконує завдання з черги jobs (у процесі job_worker.py)"""
+    try:
+        with GENERATIONS_IN_FLIGHT.track(kind=job.kind):
+            await GENERATORS[job.kind](job.chat_id, **job.params)
+    except Exception:
+        await fail_job(job)
+        raise
+
+async def fail_job(job):
+    logger.error(f"Job {job.id} ({job.kind}) failed for user {job.chat_id} after {job.attempts} attempts")
+    await bot.send_message(
+        job.chat_id, "⚠ Не вдалося підібрати фільми. Спробуйте ще раз:",
+        reply_markup=get_retry_markup(is_history=job.kind == "similar")
+    )
+
 def get_continue_markup():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add("⏭️ Пропустити", "⬅️ Повернутись в головне меню")
@@ -271,14 +580,10 @@ def is_valid_input(text):
     return bool(re.match(r"^[a-zA-Zа-яА-ЯіІїЇєЄґҐ\s,]+$", text.strip()))
 
 @bot.message_handler(commands=['start'])
-def send_welcome(message):
+async def send_welcome(message):
     chat_id = message.chat.id
-    user_data[chat_id] = {
-        'step': None,
-        'genre': '',
-        'favorites': [],
-        'preferences': ''
-    }
+    prefetcher.cancel(chat_id)
+    await sessions.save(Session(chat_id))
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add("🔍 Новий підбір фільмів", "📜 Історія рекомендацій")
 
@@ -294,18 +599,20 @@ def send_welcome(message):
         "Обери дію нижче:"
     )
 
-    bot.send_message(chat_id, intro_text, reply_markup=markup, parse_mode="Markdown")
+    await bot.send_message(chat_id, intro_text, reply_markup=markup, parse_mode="Markdown")
     log_user_action(chat_id, "Start command")
 
-@bot.message_handler(func=lambda msg: msg.text == "📜 Історія рекомендацій")
-def show_previous_films(message):
+@router.text("📜 Історія рекомендацій")
+async def show_previous_films(message):
     chat_id = message.chat.id
-    films = get_user_recommendations(chat_id)
+    prefetcher.cancel(chat_id)
+    films = await asyncio.to_thread(get_user_recommendations, chat_id)
+    logger.info(f"Retrieved {len(films)} recommendations for user {chat_id}")
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add("⬅️ Повернутись в головне меню")
 
     if not films:
-        bot.send_message(chat_id, "😔 У вас ще немає збережених рекомендацій.", reply_markup=markup)
+        await bot.send_message(chat_id, "😔 У вас ще немає збережених рекомендацій.", reply_markup=markup)
         log_user_action(chat_id, "Show history", "No recommendations")
         return
 
@@ -313,43 +620,39 @@ def show_previous_films(message):
         markup.add(film)
 
     markup.add("🗑 Очистити історію")
-    bot.send_message(
+    await bot.send_message(
         chat_id,
         "🔁 Обери фільм зі списку нижче, щоб я знайшов *схожі фільми* на нього. Також можна очистити історію, якщо потрібно.",
         reply_markup=markup,
         parse_mode="Markdown"
     )
-    user_data[chat_id] = {'step': 'similar', 'last_action': 'show_history'}
+    await sessions.save(Session(chat_id, step='similar', last_action='show_history'))
     log_user_action(chat_id, "Show history", f"{len(films)} recommendations")
 
-@bot.message_handler(func=lambda msg: msg.text == "⬅️ Повернутись в головне меню")
-def back_to_menu(message):
+@router.text("⬅️ Повернутись в головне меню")
+async def back_to_menu(message):
     chat_id = message.chat.id
     log_user_action(chat_id, "Back to main menu")
-    send_welcome(message)
+    await send_welcome(message)
 
-@bot.message_handler(func=lambda msg: msg.text == "🔍 Новий підбір фільмів")
-def start_new_recommendation(message):
+@router.text("🔍 Новий підбір фільмів")
+async def start_new_recommendation(message):
     chat_id = message.chat.id
-    user_data[chat_id] = {
-        'step': 'genre',
-        'genre': '',
-        'favorites': [],
-        'preferences': ''
-    }
-    bot.send_message(chat_id, "🎭 Напиши бажаний жанр або натисни ⏭️ Пропустити:", reply_markup=get_continue_markup())
+    prefetcher.cancel(chat_id)
+    await sessions.save(Session(chat_id, step='genre'))
+    await bot.send_message(chat_id, "🎭 Напиши бажаний жанр або натисни ⏭️ Пропустити:", reply_markup=get_continue_markup())
     log_user_action(chat_id, "Start new recommendation")
 
-@bot.message_handler(func=lambda msg: user_data.get(msg.chat.id, {}).get('step') == 'genre')
-def handle_genre(message):
+@router.step('genre')
+async def handle_genre(message):
     chat_id = message.chat.id
     if message.text == "⬅️ Повернутись в головне меню":
-        send_welcome(message)
+        await send_welcome(message)
         return
 
     if message.text != "⏭️ Пропустити":
         if not is_valid_input(message.text):
-            bot.send_message(chat_id, "⚠️ Жанр повинен містити лише літери та пробіли. Спробуй ще раз.")
+            await bot.send_message(chat_id, "⚠️ Жанр повинен містити лише літери та пробіли. Спробуй ще раз.")
             log_user_action(chat_id, "Invalid genre input", message.text)
             return
         genre = message.text.strip()
@@ -358,22 +661,21 @@ def handle_genre(message):
         genre = ""
         log_user_action(chat_id, "Genre skipped")
 
-    user_data[chat_id]['genre'] = genre
-    user_data[chat_id]['step'] = 'favorites'
-    bot.send_message(chat_id, "🎞 Напиши улюблені фільми (через кому) або натисни ⏭️ Пропустити:", reply_markup=get_continue_markup())
+    await sessions.update(chat_id, genre=genre, step='favorites')
+    await bot.send_message(chat_id, "🎞 Напиши улюблені фільми (через кому) або натисни ⏭️ Пропустити:", reply_markup=get_continue_markup())
 
-@bot.message_handler(func=lambda msg: user_data.get(msg.chat.id, {}).get('step') == 'favorites')
-def handle_favorites(message):
+@router.step('favorites')
+async def handle_favorites(message):
     chat_id = message.chat.id
     if message.text == "⬅️ Повернутись в головне меню":
-        send_welcome(message)
+        await send_welcome(message)
         return
 
     if message.text != "⏭️ Пропустити":
         favorites_raw = [f.strip() for f in message.text.split(',') if f.strip()]
         invalid = [f for f in favorites_raw if not is_valid_input(f)]
         if invalid:
-            bot.send_message(chat_id, f"⚠️ Ці назви містять недопустимі символи: {', '.join(invalid)}. Спробуй ще раз.")
+            await bot.send_message(chat_id, f"⚠️ Ці назви містять недопустимі символи: {', '.join(invalid)}. Спробуй ще раз.")
             log_user_action(chat_id, "Invalid favorites input", message.text)
             return
         favorites = favorites_raw
@@ -382,20 +684,19 @@ def handle_favorites(message):
         favorites = []
         log_user_action(chat_id, "Favorites skipped")
 
-    user_data[chat_id]['favorites'] = favorites
-    user_data[chat_id]['step'] = 'preferences'
-    bot.send_message(chat_id, "✨ Що хочеш бачити у фільмі? (або натисни ⏭️ Пропустити):", reply_markup=get_continue_markup())
+    await sessions.update(chat_id, favorites=favorites, step='preferences')
+    await bot.send_message(chat_id, "✨ Що хочеш бачити у фільмі? (або натисни ⏭️ Пропустити):", reply_markup=get_continue_markup())
 
-@bot.message_handler(func=lambda msg: user_data.get(msg.chat.id, {}).get('step') == 'preferences')
-def handle_preferences(message):
+@router.step('preferences')
+async def handle_preferences(message):
     chat_id = message.chat.id
     if message.text == "⬅️ Повернутись в головне меню":
-        send_welcome(message)
+        await send_welcome(message)
         return
 
     if message.text != "⏭️ Пропустити":
         if not is_valid_input(message.text):
-            bot.send_message(chat_id, "⚠️ Побажання можуть містити лише літери, пробіли та кому. Спробуй ще раз.")
+            await bot.send_message(chat_id, "⚠️ Побажання можуть містити лише літери, пробіли та кому. Спробуй ще раз.")
             log_user_action(chat_id, "Invalid preferences input", message.text)
             return
         prefs = message.text.strip()
@@ -404,52 +705,34 @@ def handle_preferences(message):
         prefs = ""
         log_user_action(chat_id, "Preferences skipped")
 
-    genre = user_data[chat_id].get('genre', '').strip()
-    favorites = user_data[chat_id].get('favorites', [])
+    session = await sessions.get(chat_id)
+    genre = session.genre.strip()
+    favorites = session.favorites
 
     if not genre and not favorites and not prefs:
-        bot.send_message(chat_id, "⚠️ Потрібно вказати хоча б один параметр: жанр, улюблені фільми або побажання. Спробуйте знову.")
-        user_data[chat_id]['step'] = 'genre'
-        bot.send_message(chat_id, "🎭 Напиши бажаний жанр (або натисни ⏭️ Пропустити):", reply_markup=get_continue_markup())
+        await bot.send_message(chat_id, "⚠️ Потрібно вказати хоча б один параметр: жанр, улюблені фільми або побажання. Спробуйте знову.")
+        await sessions.update(chat_id, step='genre')
+        await bot.send_message(chat_id, "🎭 Напиши бажаний жанр (або натисни ⏭️ Пропустити):", reply_markup=get_continue_markup())
         log_user_action(chat_id, "No parameters provided")
         return
 
-    user_data[chat_id]['preferences'] = prefs
-    user_data[chat_id]['step'] = 'done'
-    generate_personal_recommendation(chat_id)
+    await sessions.update(chat_id, preferences=prefs, step='done')
+    await start_generation("recommendation", chat_id)
 
-@bot.message_handler(func=lambda message: user_data.get(message.chat.id, {}).get('recommendations'))
-def show_film_details(message):
+async def show_film_details(message):
     try:
         chat_id = message.chat.id
         selected_film = message.text.strip()
         log_user_action(chat_id, "Film details requested", selected_film)
 
-        film_name = selected_film
-        film_name = re.sub(r"^\d+\)\s*", "", film_name)
-        film_name = re.sub(r"\s*\(\d{4}\)", "", film_name)
-        film_name = film_name.strip()
-
-        search_response = requests.get(
-            f"https://api.themoviedb.org/3/search/movie",
-            params={"query": film_name, "api_key": TMDB_API_KEY, "language": "uk"},
-            timeout=10
-        ).json()
+        film_name = clean_film_title(selected_film)
+        details_response = await tmdb.find_movie(film_name)
 
-        if not search_response.get("results"):
-            bot.send_message(chat_id, f"😔 Не вдалося знайти інформацію про фільм: {film_name}")
+        if not details_response:
+            await bot.send_message(chat_id, f"😔 Не вдалося знайти інформацію про фільм: {film_name}")
             log_user_action(chat_id, "Film not found", film_name)
             return
 
-        movie = search_response["results"][0]
-        movie_id = movie["id"]
-
-        details_response = requests.get(
-            f"https://api.themoviedb.org/3/movie/{movie_id}",
-            params={"api_key": TMDB_API_KEY, "language": "uk"},
-            timeout=10
-        ).json()
-
         title = details_response.get("title", "Невідомо")
         year = details_response.get("release_date", "N/A")[:4]
         rating = details_response.get("vote_average", "N/A")
@@ -465,18 +748,54 @@ def show_film_details(message):
 
         poster_path = details_response.get("poster_path")
         if poster_path:
-            poster_url = f"https://image.tmdb.org/t/p/w500{poster_path}"
-            bot.send_photo(chat_id, poster_url, caption, parse_mode="HTML")
+            await posters.send(bot, chat_id, details_response["id"], poster_path, caption, parse_mode="HTML")
             logger.info(f"Film details sent with poster for user {chat_id}: {title}")
         else:
-            bot.send_message(chat_id, caption, parse_mode="HTML")
+            await bot.send_message(chat_id, caption, parse_mode="HTML")
             logger.info(f"Film details sent without poster for user {chat_id}: {title}")
 
     except Exception as e:
         logger.error(f"Error showing film details for user {chat_id}: {str(e)}")
-        bot.send_message(chat_id, f"⚠ Виникла помилка: {str(e)}")
+        # деталі помилки лише в лозі: у них можуть бути адреси й параметри запитів
+        await bot.send_message(chat_id, "⚠ Не вдалося отримати інформацію про фільм. Спробуйте пізніше.")
+
+@bot.message_handler(content_types=['text'])
+async def dispatch_message(message):
+    session = await sessions.get(message.chat.id)
+    handler = router.resolve(message.text, session.step)
+    if handler is None and session.recommendations:
+        handler = show_film_details
+    if handler is not None:
+        await handler(message)
+
+async def close_resources():
+    await outbox.close()
+    await tmdb.close()
+    await ai_pool.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+
+async def startup():
+    global metrics_runner
+    if METRICS_PORT:
+        # у webhook.py і job_worker.py кожен процес слухає свій порт: METRICS_PORT + номер воркера
+        port = METRICS_PORT + int(os.getenv("WORKER_INDEX", "0"))
+        metrics_runner = await metrics.start_server(METRICS_HOST, port)
+    await sessions.purge()
+    await titles.load()
+    if similarity is not None:
+        similarity.add_delta(await asyncio.to_thread(get_film_vectors))
+
+async def run_bot():
+    await startup()
+    try:
+        await bot.polling()
+    finally:
+        await close_resources()
+        logger.info("Bot stopped")
 
 if __name__ == "__main__":
     init_db()
+    logger.info("Database initialized")
     logger.info("Bot started")
-    bot.polling()
\ No newline at end of file
+    asyncio.run(run_bot())
\ No newline at end of file
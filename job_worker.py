@@ -0,0 +1,108 @@
+import os
+import signal
+import asyncio
+import argparse
+import importlib
+import multiprocessing
+from dotenv import load_dotenv
+from telebot import asyncio_helper
+from storage import init_db
+
+load_dotenv()
+JOB_BOT_MODULE = os.getenv("JOB_BOT_MODULE", "main")
+JOB_WORKER_PROCESSES = int(os.getenv("JOB_WORKER_PROCESSES", "1"))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "8"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_STATS_INTERVAL = float(os.getenv("JOB_STATS_INTERVAL", "30"))
+
+
+async def execute(bot_module, job):
+    try:
+        await bot_module.run_job(job)
+    except Exception as e:
+        print(f"[JOBS] job {job.id} ({job.kind}, chat {job.chat_id}) failed: {e}")
+        await bot_module.jobs.finish(job, error=str(e) or type(e).__name__)
+    else:
+        await bot_module.jobs.finish(job)
+
+
+async def maintain(bot_module, name):
+    """Закриває покинуті завдання, чистить старі й показує глибину черги"""
+    jobs = bot_module.jobs
+    for job in await jobs.abandoned():
+        print(f"[JOBS] job {job.id} ({job.kind}, chat {job.chat_id}) abandoned after {job.attempts} attempts")
+        try:
+            await bot_module.fail_job(job)
+        except Exception as e:
+            print(f"[JOBS] failed to notify chat {job.chat_id}: {e}")
+    await jobs.purge()
+    print(f"[JOBS] {name}: {await jobs.stats()}")
+
+
+async def work(module_name, concurrency, name="job-worker"):
+    """Бере завдання з черги й виконує до concurrency з них одночасно, поки не прийде SIGINT/SIGTERM"""
+    bot_module = importlib.import_module(module_name)
+    await bot_module.startup()
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    running = set()
+    next_maintenance = 0
+    try:
+        while not stopping.is_set():
+            if loop.time() >= next_maintenance:
+                await maintain(bot_module, name)
+                next_maintenance = loop.time() + JOB_STATS_INTERVAL
+            if len(running) >= concurrency:
+                await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            job = await bot_module.jobs.claim()
+            if job is None:
+                try:
+                    await asyncio.wait_for(stopping.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(execute(bot_module, job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        # взяті завдання доробляються; якщо процес уб'ють раніше, їх забере інший воркер після кінця оренди
+        await asyncio.gather(*running, return_exceptions=True)
+        await bot_module.close_resources()
+        # сесія HTTP з'являється лише після першого запиту до Bot API
+        if asyncio_helper.session_manager.session is not None:
+            await bot_module.bot.close_session()
+
+
+def run_worker(module_name, concurrency, index):
+    os.environ["WORKER_INDEX"] = str(index)
+    asyncio.run(work(module_name, concurrency, f"job-worker-{index}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воркери черги генерації (GENERATION_MODE=queue)")
+    parser.add_argument("--module", default=JOB_BOT_MODULE)
+    parser.add_argument("--processes", type=int, default=JOB_WORKER_PROCESSES)
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    init_db()
+    print(f"Job workers started: {args.processes} x {args.concurrency}")
+    if args.processes == 1:
+        run_worker(args.module, args.concurrency, 0)
+    else:
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(target=run_worker, args=(args.module, args.concurrency, index), name=f"job-worker-{index}")
+            for index in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        # Ctrl+C отримують і воркери: вони перестають брати завдання й доробляють взяті
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: [process.terminate() for process in processes])
+        for process in processes:
+            process.join()
@@ -0,0 +1,64 @@
+import json
+import time
+import asyncio
+from typing import NamedTuple
+
+import storage
+
+
+class Job(NamedTuple):
+    id: int
+    kind: str
+    chat_id: int
+    params: dict
+    attempts: int
+
+
+class JobQueue:
+    """Стійка черга завдань генерації в SQLite, спільна для процесів бота і job_worker.py.
+
+    Воркер бере завдання в оренду на lease секунд. Якщо він упав, не завершивши завдання, після
+    кінця оренди його бере інший воркер, але не більше max_attempts разів. У чату може бути лише
+    одне незавершене завдання. Завершені завдання зберігаються keep секунд.
+    """
+
+    def __init__(self, lease=120, max_attempts=3, keep=86400):
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.keep = keep
+
+    @staticmethod
+    def _job(row):
+        job_id, kind, chat_id, payload, attempts = row
+        return Job(job_id, kind, chat_id, json.loads(payload), attempts)
+
+    async def put(self, kind, chat_id, **params):
+        """Повертає id завдання або None, якщо попереднє завдання чату ще не виконано"""
+        payload = json.dumps(params, ensure_ascii=False)
+        return await asyncio.to_thread(storage.enqueue_job, kind, chat_id, payload)
+
+    async def claim(self):
+        now = time.time()
+        row = await asyncio.to_thread(storage.claim_job, now, now + self.lease, self.max_attempts)
+        return self._job(row) if row else None
+
+    async def finish(self, job, error=None):
+        await asyncio.to_thread(storage.finish_job, job.id, error)
+
+    async def abandoned(self):
+        """Завдання, на яких воркери падали max_attempts разів; вони позначаються невдалими"""
+        rows = await asyncio.to_thread(storage.fail_abandoned_jobs, time.time(), self.max_attempts)
+        return [self._job(row) for row in rows]
+
+    async def purge(self):
+        await asyncio.to_thread(storage.purge_jobs, int(time.time()) - self.keep)
+
+    async def stats(self):
+        counts, oldest = await asyncio.to_thread(storage.count_jobs)
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_queued": oldest,
+        }
@@ -0,0 +1,149 @@
+import json
+import queue
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+from ratelimit import TokenBucket
+
+# Атрибути, які є в кожному LogRecord; все інше прийшло з extra= і потрапляє в JSON як поля події
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Один запис — один рядок JSON: час, рівень, логер, повідомлення і поля з extra="""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in STANDARD_ATTRS and not name.startswith("_"):
+                data[name] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускає лише частку rates[event] записів з полем event; попередження й помилки — завжди"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, "event", None))
+        return rate is None or record.levelno >= logging.WARNING or random.random() < rate
+
+
+class RateCapFilter(logging.Filter):
+    """Не більше caps[рівень] записів на секунду для кожного рівня; решта відкидається і рахується.
+
+    Наступний пропущений запис цього рівня отримує поле dropped — скільки записів перед ним загубилося.
+    """
+
+    def __init__(self, caps):
+        super().__init__()
+        self.buckets = {level: TokenBucket(rate) for level, rate in caps.items()}
+        self.dropped = dict.fromkeys(caps, 0)
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        bucket = self.buckets.get(record.levelno)
+        if bucket is None:
+            return True
+        with self._lock:
+            if not bucket.try_acquire():
+                self.dropped[record.levelno] += 1
+                return False
+            if self.dropped[record.levelno]:
+                record.dropped = self.dropped[record.levelno]
+                self.dropped[record.levelno] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, що не блокує виклик: коли в черзі вже maxsize записів, новий відкидається"""
+
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.SimpleQueue())
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def prepare(self, record):
+        # запис не копіюється: цей обробник єдиний у кореневого логера.
+        # Аргументи підставляються одразу, бо поки запис чекає в черзі, об'єкти можуть змінитися
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(record)
+
+
+def parse_levels(value):
+    """"INFO=200,WARNING=50" -> {logging.INFO: 200.0, logging.WARNING: 50.0}"""
+    result = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, number = item.partition("=")
+        result[logging.getLevelName(name.strip().upper())] = float(number)
+    return result
+
+
+def parse_rates(value):
+    """"user_action=0.1,ai_response=0.5" -> {"user_action": 0.1, "ai_response": 0.5}"""
+    result = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, number = item.partition("=")
+        result[name.strip()] = float(number)
+    return result
+
+
+def setup_logging(path, level=logging.INFO, max_bytes=10 * 1024 * 1024, backups=5, rotate_when=None,
+                  sample=None, caps=None, queue_size=10000, console=True):
+    """Налаштовує кореневий логер на запис через чергу й окремий потік.
+
+    Виклик logger.info() лише фільтрує запис і кладе його в чергу; форматування в JSON і запис у файл
+    (з ротацією за розміром або, якщо задано rotate_when, за часом) відбуваються в потоці
+    QueueListener. Повертає запущений listener; listener.stop() дописує чергу до кінця.
+    """
+    if rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(path, when=rotate_when, backupCount=backups, encoding="utf-8")
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    file_handler.setFormatter(JSONFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        handlers.append(console_handler)
+
+    queue_handler = DroppingQueueHandler(queue_size)
+    if sample:
+        queue_handler.addFilter(SamplingFilter(sample))
+    if caps:
+        queue_handler.addFilter(RateCapFilter(caps))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
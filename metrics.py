@@ -0,0 +1,287 @@
+import time
+import bisect
+import asyncio
+import functools
+import threading
+from aiohttp import web
+
+# Межі кошиків гістограм затримки, секунд: від швидких запитів SQLite до довгих відповідей ШІ
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _series(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, value in self._series():
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}")
+        return lines
+
+    def summary(self):
+        return [{"labels": dict(zip(self.labels, key)), "value": value} for key, value in self._series()]
+
+
+class Counter(Metric):
+    """Лічильник, що лише зростає: запити, тайм-аути, влучання в кеш"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Поточне значення: скільки запитів виконується зараз, довжина черги.
+
+    Якщо передано fn, значення (без міток) читається з неї в момент експорту.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def track(self, **labels):
+        """with gauge.track(): ... — збільшує значення на час виконання блоку"""
+        return _Tracker(self, labels)
+
+    def _series(self):
+        if self.fn is not None:
+            return [((), self.fn())]
+        return super()._series()
+
+
+class Histogram(Metric):
+    """Гістограма значень (зазвичай затримок у секундах) з кумулятивними кошиками як у Prometheus.
+
+    quantile() оцінює p50/p95/p99 лінійною інтерполяцією всередині кошика, як histogram_quantile().
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # лічильники кошиків (останній — +Inf), сума і кількість
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """with histogram.time(stage="x"): ... — записує тривалість блоку, навіть якщо він упав"""
+        self._key(labels)
+        return _Timer(self, labels)
+
+    def _quantile(self, counts, total, q):
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def quantile(self, q, **labels):
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            counts, total = (list(series[0]), series[2]) if series else ([], 0)
+        return self._quantile(counts, total, q)
+
+    def _series(self):
+        with self._lock:
+            return [(key, (list(counts), total_sum, count)) for key, (counts, total_sum, count) in self._values.items()]
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, (counts, total_sum, count) in self._series():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_number(float(bound))
+                labels = _format_labels(self.labels, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_number(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+    def summary(self):
+        result = []
+        for key, (counts, total_sum, count) in self._series():
+            entry = {"labels": dict(zip(self.labels, key)), "count": count, "sum": round(total_sum, 6)}
+            for q in QUANTILES:
+                value = self._quantile(counts, count, q)
+                entry[f"p{round(q * 100)}"] = round(value, 6) if value is not None else None
+            result.append(entry)
+        return result
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class _Tracker:
+    def __init__(self, gauge, labels):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(**self.labels)
+        return self
+
+    def __exit__(self, *exc):
+        self.gauge.dec(**self.labels)
+
+
+class Registry:
+    """Набір метрик процесу. Метрика з тим самим ім'ям створюється один раз і потім повертається"""
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as {metric.type}")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=(), fn=None):
+        gauge = self._get(Gauge, name, help, labels)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def expose(self):
+        """Усі метрики в текстовому форматі Prometheus"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Усі метрики як словник; для гістограм — кількість, сума і p50/p95/p99"""
+        return {name: metric.summary() for name, metric in list(self.metrics.items())}
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def timed(histogram, **labels):
+    """Декоратор: записує тривалість кожного виклику звичайної або асинхронної функції"""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def create_app(registry=REGISTRY):
+    async def handle_metrics(request):
+        return web.Response(text=registry.expose(), content_type="text/plain", charset="utf-8")
+
+    async def handle_summary(request):
+        return web.json_response(registry.summary())
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/metrics.json", handle_summary)
+    return app
+
+
+async def start_server(host, port, registry=REGISTRY):
+    """Запускає HTTP-сервер метрик у поточному циклі подій; повертає runner для runner.cleanup()"""
+    runner = web.AppRunner(create_app(registry), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
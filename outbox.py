@@ -0,0 +1,131 @@
+import time
+import asyncio
+import contextlib
+from collections import OrderedDict
+
+from telebot.asyncio_helper import ApiTelegramException
+
+import metrics
+from ratelimit import TokenBucket
+
+# Методи, що створюють або змінюють повідомлення в чаті: на них діють ліміти Telegram на надсилання
+LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+OUTBOX_WAIT = metrics.histogram("telegram_outbox_wait_seconds", "Time a Bot API call waited for send limits and flood waits")
+OUTBOX_WAITING = metrics.gauge("telegram_outbox_waiting", "Bot API calls waiting for send limits")
+FLOOD_WAITS = metrics.counter("telegram_flood_waits_total", "429 answers from the Bot API, by method", ["method"])
+
+
+class _Chat:
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.lock = asyncio.Lock()
+        self.paused_until = 0.0
+
+
+class Outbox:
+    """Черга вихідних викликів Bot API з урахуванням лімітів Telegram.
+
+    Надсилання й редагування повідомлень одного чату йдуть строго по черзі і не частіше ніж
+    chat_rate на секунду (із запасом chat_burst), усіх чатів разом — не частіше ніж global_rate на
+    секунду, тож на піку вони чекають у черзі, а не отримують 429. Якщо Telegram все ж відповів 429,
+    чат (або весь бот, якщо виклик не стосується чату) стає на паузу на retry_after секунд, і виклик
+    повторюється до max_retries разів. Стан зберігається для не більше ніж max_chats останніх чатів.
+
+    Ліміти чатів діють у межах процесу. Загальний теж, якщо не передано спільне для процесів
+    відро global_bucket (напр. SharedTokenBucket).
+    """
+
+    def __init__(self, chat_rate=1, chat_burst=3, global_rate=30, global_burst=None, max_retries=3,
+                 max_retry_after=60, max_chats=10000, global_bucket=None):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = global_bucket or TokenBucket(global_rate, global_burst)
+        self._global_lock = asyncio.Lock()
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.max_chats = max_chats
+        self.chats = OrderedDict()
+        self.paused_until = 0.0
+        self.flood_waits = 0
+        self.background = set()
+        self.failed = 0
+
+    def _chat(self, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = _Chat(self.chat_rate, self.chat_burst)
+            if len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        else:
+            self.chats.move_to_end(chat_id)
+        return chat
+
+    async def _wait(self, chat, limited):
+        while True:
+            delay = max(self.paused_until, chat.paused_until if chat else 0.0) - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        if limited:
+            if chat is not None:
+                await chat.bucket.acquire()
+            # замок робить чергу до загального відра FIFO, інакше хтось може чекати значно довше за інших
+            async with self._global_lock:
+                await self.global_bucket.acquire()
+
+    async def call(self, chat_id, method, fn, retry=True):
+        """Виконує виклик Bot API fn() у черзі чату chat_id; method — назва методу (sendMessage, ...)"""
+        chat = self._chat(chat_id) if chat_id is not None else None
+        limited = method.startswith(LIMITED_PREFIXES)
+        # порядок потрібен лише повідомленням; видалення та інші виклики не чекають черги чату
+        async with chat.lock if chat is not None and limited else contextlib.nullcontext():
+            for attempt in range(self.max_retries + 1):
+                with OUTBOX_WAIT.time(), OUTBOX_WAITING.track():
+                    await self._wait(chat, limited)
+                try:
+                    return await fn()
+                except ApiTelegramException as e:
+                    retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after")
+                    if e.error_code != 429 or retry_after is None:
+                        raise
+                    FLOOD_WAITS.inc(method=method)
+                    self.flood_waits += 1
+                    if not retry or attempt == self.max_retries or retry_after > self.max_retry_after:
+                        raise
+                    paused_until = time.monotonic() + retry_after
+                    if chat is not None:
+                        chat.paused_until = max(chat.paused_until, paused_until)
+                    else:
+                        self.paused_until = max(self.paused_until, paused_until)
+
+    def wrap(self, process_request):
+        """Обгортає asyncio_helper._process_request, щоб усі виклики бота йшли через чергу"""
+        async def request(token, url, method='get', params=None, files=None, **kwargs):
+            chat_id = params.get("chat_id") if params else None
+            # _process_request змінює params, тож кожна спроба отримує свою копію;
+            # файли-потоки повторно не надсилаються
+            return await self.call(
+                chat_id, url,
+                lambda: process_request(token, url, method, dict(params) if params else params, files, **kwargs),
+                retry=not files
+            )
+        return request
+
+    def later(self, coro):
+        """Виконує виклик у фоні, не затримуючи обробник (напр. видалення заглушки); помилки лише рахуються"""
+        task = asyncio.create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self.background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+
+    async def close(self):
+        await asyncio.gather(*self.background, return_exceptions=True)
+
+    def stats(self):
+        return {"chats": len(self.chats), "flood_waits": self.flood_waits, "background": len(self.background),
+                "failed": self.failed}
@@ -0,0 +1,113 @@
+import re
+import json
+from typing import NamedTuple, Optional
+
+# Один пункт списку: номер "1." / "1)" / "(1)" або маркер "-", "*", "•" на початку рядка, після ";" чи ":";
+# номер — ще й після пробілу ("Рекомендую 1) ..."), маркер ні, бо " - " буває в описі
+ITEM_PATTERN = re.compile(
+    r"(?:(?:^|[;:])[ \t]*(?:\(?\d{1,2}[.)]|[-*•–—+])|(?<=\s)\(?\d{1,2}[.)])[ \t]+(?P<item>[^\n;]+)",
+    re.MULTILINE,
+)
+# Рядок без маркера приймається лише тоді, коли в ньому є рік у дужках
+PLAIN_PATTERN = re.compile(r"^[ \t]*(?P<item>[^\n]+?\((?:19|20)\d{2}\)[^\n]*)$", re.MULTILINE)
+YEAR_PATTERN = re.compile(r"[\(\[,–—-]\s*((?:19|20)\d{2})\s*[\)\]]?")
+DESCRIPTION_PATTERN = re.compile(r"\s[–—-]\s")
+LINK_PATTERN = re.compile(r"\[([^\]]+)\]\((?:[^()\s]|\([^()\s]*\))*\)|https?://\S+|www\.\S+")
+JSON_PATTERN = re.compile(r"\[.*\]|\{.*\}", re.DOTALL)
+TITLE_STRIP = " \t*_`\"'«»“”„:.-–—"
+
+
+class FilmRecord(NamedTuple):
+    title: str
+    year: Optional[int] = None
+
+    def __str__(self):
+        return f"{self.title} ({self.year})" if self.year else self.title
+
+
+def parse_item(item):
+    """Назва і рік з одного пункту списку; опис після тире відкидається"""
+    item = LINK_PATTERN.sub(lambda match: match.group(1) or "", item)
+    year = None
+    match = YEAR_PATTERN.search(item)
+    if match:
+        year = int(match.group(1))
+        item = item[:match.start()]
+    else:
+        item = DESCRIPTION_PATTERN.split(item, maxsplit=1)[0]
+    if item.count("(") > item.count(")"):
+        # "Вартові Галактики (Guardians of the Galaxy, 2014)" — рік був усередині дужок з оригінальною назвою
+        item = item[:item.rindex("(")]
+    title = " ".join(item.replace("**", "").replace("__", "").split()).strip(TITLE_STRIP)
+    if not title or len(title) > 120:
+        return None
+    return FilmRecord(title, year)
+
+
+def parse_line(line):
+    """Розбирає один рядок потокової відповіді; None, якщо це не пункт списку"""
+    match = ITEM_PATTERN.search(line.strip())
+    return parse_item(match.group("item")) if match else None
+
+
+def _parse_json(text):
+    match = JSON_PATTERN.search(text)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if isinstance(data, dict):
+        data = next((value for value in data.values() if isinstance(value, list)), [data])
+    records = []
+    for entry in data:
+        if isinstance(entry, str):
+            record = parse_item(entry)
+        elif isinstance(entry, dict):
+            title = entry.get("title") or entry.get("name") or entry.get("назва") or ""
+            year = str(entry.get("year") or entry.get("рік") or "")
+            record = parse_item(f"{title} ({year})" if year.isdigit() else str(title))
+        else:
+            record = None
+        if record:
+            records.append(record)
+    return records
+
+
+def parse_films(text, limit=5):
+    """Повертає до limit унікальних FilmRecord з відповіді ШІ.
+
+    Розуміє нумеровані й марковані списки (зокрема в один рядок через ";"), markdown і посилання,
+    JSON-масиви; якщо маркерів немає, бере рядки з роком у дужках.
+    """
+    if not text:
+        return []
+    records = None
+    if '{"' in text or '["' in text:
+        records = _parse_json(text)
+    if not records:
+        items = [match.group("item") for match in ITEM_PATTERN.finditer(text)]
+        if not items:
+            items = [match.group("item") for match in PLAIN_PATTERN.finditer(text)]
+        records = (parse_item(item) for item in items)
+
+    films, seen = [], set()
+    for record in records:
+        if record is None:
+            continue
+        key = record.title.lower()
+        if key not in seen:
+            seen.add(key)
+            films.append(record)
+            if len(films) == limit:
+                break
+    return films
+
+
+def has_films(text):
+    return bool(parse_films(text, 1))
+
+
+def format_films(films):
+    return "\n".join(f"{i}) {film}" for i, film in enumerate(films, 1))
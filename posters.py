@@ -0,0 +1,75 @@
+import asyncio
+
+from telebot.asyncio_helper import ApiTelegramException
+
+import metrics
+import storage
+from cache import TTLCache
+
+POSTER_URL = "https://image.tmdb.org/t/p/{size}{path}"
+
+POSTER_SENDS = metrics.counter("poster_sends_total", "Film posters sent, by source (file_id, url, or stale file_id)", ["source"])
+
+
+class PosterCache:
+    """file_id постерів, які Telegram уже завантажив.
+
+    Перше надсилання постера йде за URL TMDB, і Telegram сам завантажує зображення. file_id з його
+    відповіді запам'ятовується для (movie_id, poster_path) у пам'яті та SQLite, і наступні надсилання
+    того ж постера йдуть за file_id без повторного завантаження. Якщо Telegram відхиляє file_id
+    (файл більше недоступний), запис видаляється, а постер надсилається за URL і кешується знову.
+    """
+
+    def __init__(self, cache_size=10000, ttl=86400, size="w500", persistent=True):
+        self.file_ids = TTLCache(cache_size, ttl)
+        self.size = size
+        self.persistent = persistent
+        self.stale = 0
+
+    def url(self, poster_path):
+        return POSTER_URL.format(size=self.size, path=poster_path)
+
+    async def get(self, movie_id, poster_path):
+        key = (movie_id, poster_path)
+        file_id = self.file_ids.get(key)
+        if file_id is None and self.persistent:
+            file_id = await asyncio.to_thread(storage.get_poster_file_id, movie_id, poster_path)
+            if file_id is not None:
+                self.file_ids.set(key, file_id)
+        return file_id
+
+    async def set(self, movie_id, poster_path, file_id):
+        self.file_ids.set((movie_id, poster_path), file_id)
+        if self.persistent:
+            await asyncio.to_thread(storage.save_poster_file_id, movie_id, poster_path, file_id)
+
+    async def forget(self, movie_id, poster_path):
+        self.file_ids.pop((movie_id, poster_path))
+        if self.persistent:
+            await asyncio.to_thread(storage.delete_poster_file_id, movie_id, poster_path)
+
+    async def send(self, bot, chat_id, movie_id, poster_path, caption=None, **kwargs):
+        """Надсилає постер фільму через bot.send_photo(): за file_id, якщо він відомий, інакше за URL"""
+        file_id = await self.get(movie_id, poster_path)
+        if file_id is not None:
+            try:
+                message = await bot.send_photo(chat_id, file_id, caption, **kwargs)
+                POSTER_SENDS.inc(source="file_id")
+                return message
+            except ApiTelegramException as e:
+                # інші помилки 400 (напр. у підписі) повторилися б і з URL
+                if e.error_code != 400 or "file" not in (e.description or "").lower():
+                    raise
+                POSTER_SENDS.inc(source="stale")
+                self.stale += 1
+                await self.forget(movie_id, poster_path)
+
+        message = await bot.send_photo(chat_id, self.url(poster_path), caption, **kwargs)
+        POSTER_SENDS.inc(source="url")
+        if message.photo:
+            # найбільший розмір іде останнім
+            await self.set(movie_id, poster_path, message.photo[-1].file_id)
+        return message
+
+    def stats(self):
+        return {"cached": len(self.file_ids), "hits": self.file_ids.hits, "misses": self.file_ids.misses, "stale": self.stale}
@@ -0,0 +1,217 @@
+import asyncio
+import time
+
+import g4f
+
+from streaming import read_stream
+
+
+class Backend:
+    """Пара провайдер/модель g4f і статистика її роботи"""
+
+    def __init__(self, model, provider=None):
+        self.model = model
+        self.provider = provider
+        self.name = f"{provider.__name__}:{model}" if provider else model
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.demoted_until = 0.0
+
+    def score(self):
+        # невідома затримка = 0, тож нові бекенди спершу пробуються
+        return (self.latency or 0.0) * (1 + 4 * self.error_rate)
+
+
+def parse_backends(spec):
+    """Розбирає рядок на кшталт "gpt-4,PollinationsAI:gpt-4o-mini" у список бекендів"""
+    backends = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        provider_name, _, model = item.rpartition(":")
+        backends.append(Backend(model, getattr(g4f.Provider, provider_name) if provider_name else None))
+    return backends
+
+
+class ProviderRegistry:
+    """Розподіляє запити до ШІ між кількома бекендами g4f.
+
+    Запит спершу йде до найкращого бекенда за EWMA затримки та частки помилок. Якщо за hedge_delay
+    секунд відповіді немає або бекенд відповів помилкою, паралельно запускається наступний (не більше
+    hedge одночасно). Перша коректна відповідь перемагає, решта запитів скасовується. Бекенди, що
+    max_failures разів поспіль не відповіли, понижуються на cooldown секунд.
+    """
+
+    def __init__(self, client, backends, hedge=2, hedge_delay=4.0, alpha=0.3, max_failures=3, cooldown=120):
+        self.client = client
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+
+    def ranked(self):
+        now = time.monotonic()
+        healthy = [b for b in self.backends if b.demoted_until <= now]
+        demoted = [b for b in self.backends if b.demoted_until > now]
+        return sorted(healthy, key=Backend.score) + sorted(demoted, key=lambda b: b.demoted_until)
+
+    def _update_latency(self, backend, latency):
+        if backend.latency is None:
+            backend.latency = latency
+        else:
+            backend.latency += self.alpha * (latency - backend.latency)
+
+    def record(self, backend, latency, ok):
+        self._update_latency(backend, latency)
+        backend.error_rate += self.alpha * ((0.0 if ok else 1.0) - backend.error_rate)
+        if ok:
+            backend.failures = 0
+            backend.demoted_until = 0.0
+        else:
+            backend.failures += 1
+            if backend.failures >= self.max_failures:
+                backend.demoted_until = time.monotonic() + self.cooldown
+
+    def stats(self):
+        now = time.monotonic()
+        return [
+            {
+                "backend": b.name,
+                "latency": b.latency,
+                "error_rate": round(b.error_rate, 3),
+                "demoted": b.demoted_until > now,
+            }
+            for b in self.backends
+        ]
+
+    async def _call(self, backend, messages):
+        response = await self.client.chat.completions.create(
+            messages=messages,
+            model=backend.model,
+            provider=backend.provider,
+            web_search=False
+        )
+        return response.choices[0].message.content
+
+    def _abandon(self, started, task):
+        task.cancel()
+        backend, start = started[task]
+        # скасований бекенд був щонайменше настільки повільним
+        elapsed = time.monotonic() - start
+        if backend.latency is None or elapsed > backend.latency:
+            self._update_latency(backend, elapsed)
+
+    async def complete(self, messages, validate=None):
+        """Повертає першу коректну відповідь серед бекендів або None"""
+        candidates = self.ranked()
+        started = {}
+        pending = set()
+
+        def launch():
+            backend = candidates[len(started)]
+            task = asyncio.create_task(self._call(backend, messages))
+            started[task] = (backend, time.monotonic())
+            pending.add(task)
+
+        launch()
+        try:
+            while pending:
+                can_hedge = len(started) < len(candidates) and len(pending) < self.hedge
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    backend, start = started[task]
+                    content = None if task.cancelled() or task.exception() else task.result()
+                    ok = bool(content) and (validate is None or validate(content))
+                    self.record(backend, time.monotonic() - start, ok)
+                    if ok:
+                        return content
+                # невдалу спробу одразу замінює наступний бекенд
+                if len(pending) < self.hedge and len(started) < len(candidates):
+                    launch()
+            return None
+        finally:
+            for task in pending:
+                self._abandon(started, task)
+
+    async def _stream(self, backend, messages, on_line):
+        stream = self.client.chat.completions.create(
+            messages=messages,
+            model=backend.model,
+            provider=backend.provider,
+            web_search=False,
+            stream=True
+        )
+        return await read_stream(stream, on_line)
+
+    async def stream(self, messages, on_line, validate=None, accept=None):
+        """Потокова відповідь з тим самим hedging, що й у complete().
+
+        Рядки кожного бекенда накопичуються окремо, поки один з них не надішле рядок, який приймає
+        accept (напр. рядок з фільмом; без accept — будь-який). Цей бекенд стає обраним: його рядки
+        передаються в on_line, а решта запитів скасовується. Помилка обраного бекенда вже не
+        замінюється іншим, бо користувач бачив частину його відповіді.
+        """
+        candidates = self.ranked()
+        started = {}
+        pending = set()
+        chosen = None
+
+        def launch():
+            backend = candidates[len(started)]
+            lines = []
+
+            def sink(line):
+                nonlocal chosen
+                if chosen is task:
+                    on_line(line)
+                    return
+                lines.append(line)
+                if chosen is None and (accept is None or accept(line)):
+                    chosen = task
+                    for other in pending - {task}:
+                        pending.discard(other)
+                        self._abandon(started, other)
+                    for buffered in lines:
+                        on_line(buffered)
+
+            task = asyncio.create_task(self._stream(backend, messages, sink))
+            started[task] = (backend, time.monotonic())
+            pending.add(task)
+
+        launch()
+        try:
+            while pending:
+                can_hedge = chosen is None and len(started) < len(candidates) and len(pending) < self.hedge
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    if task not in pending:
+                        # скасований, коли обрали інший бекенд
+                        continue
+                    pending.discard(task)
+                    backend, start = started[task]
+                    content = None if task.cancelled() or task.exception() else task.result()
+                    ok = bool(content) and (validate is None or validate(content))
+                    self.record(backend, time.monotonic() - start, ok)
+                    if task is chosen:
+                        return task.result()
+                    if ok:
+                        return content
+                if chosen is None and len(pending) < self.hedge and len(started) < len(candidates):
+                    launch()
+            return None
+        finally:
+            for task in pending:
+                self._abandon(started, task)
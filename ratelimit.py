@@ -0,0 +1,130 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import storage
+
+
+class TokenBucket:
+    """Відро токенів: поповнюється зі швидкістю rate токенів на секунду, вміщує не більше capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens=1):
+        """Скільки секунд чекати, поки у відрі з'явиться потрібна кількість токенів"""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    async def acquire(self, tokens=1):
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+
+
+class SharedTokenBucket:
+    """Відро токенів у SQLite, спільне для всіх процесів з тією ж базою (воркери webhook, job_worker.py).
+
+    acquire одразу резервує токен і чекає, поки резерв покриє поповнення, тож процеси не змагаються
+    за токени, а стають у спільну чергу, і разом не перевищують rate на секунду.
+    """
+
+    def __init__(self, name, rate, capacity=None):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity or rate
+
+    async def acquire(self, tokens=1):
+        delay = await asyncio.to_thread(storage.reserve_tokens, self.name, time.time(), self.rate, self.capacity, tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def try_acquire(self, tokens=1):
+        """Забирає токени без очікування; False, якщо їх зараз немає"""
+        delay = await asyncio.to_thread(storage.reserve_tokens, self.name, time.time(), self.rate, self.capacity, tokens,
+                                        debt=False)
+        return delay == 0
+
+
+class Rejected(Exception):
+    """Запит на генерацію не допущено; reason — "in_flight", "user_rate" або "overloaded" """
+
+    def __init__(self, reason, retry_after=0.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """Допуск до дорогих дій (генерації через ШІ) для кожного чату та для бота загалом.
+
+    Чат може мати лише одну генерацію одночасно і не більше user_rate генерацій за хвилину
+    (із запасом user_burst); це перевіряє acquire. Запити до ШІ всіх чатів разом — не більше
+    global_rate за хвилину (із запасом global_burst); цей бюджет спільний для всіх процесів (SQLite)
+    і витрачається лише тоді, коли відповіді немає в кеші чи локальному індексі (acquire_ai). Коли
+    його вичерпано, запити відкидаються одразу, а не стають у чергу за ШІ. Відра чатів зберігаються
+    для не більше ніж max_chats останніх чатів.
+    """
+
+    def __init__(self, user_rate=6, user_burst=3, global_rate=60, global_burst=20, max_chats=10000):
+        self.user_rate = user_rate / 60
+        self.user_burst = user_burst
+        self.max_chats = max_chats
+        self.global_bucket = SharedTokenBucket("generation", global_rate / 60, global_burst)
+        self.buckets = OrderedDict()
+        self.in_flight = set()
+        self.admitted = 0
+        self.rejected = {"in_flight": 0, "user_rate": 0, "overloaded": 0}
+
+    def _bucket(self, chat_id):
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.buckets[chat_id] = TokenBucket(self.user_rate, self.user_burst)
+            if len(self.buckets) > self.max_chats:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(chat_id)
+        return bucket
+
+    def _reject(self, reason, retry_after=0.0):
+        self.rejected[reason] += 1
+        raise Rejected(reason, retry_after)
+
+    def acquire(self, chat_id):
+        """Займає місце для генерації чату; кидає Rejected, якщо її не можна почати зараз"""
+        if chat_id in self.in_flight:
+            self._reject("in_flight")
+        bucket = self._bucket(chat_id)
+        if not bucket.try_acquire():
+            self._reject("user_rate", bucket.delay())
+        self.in_flight.add(chat_id)
+        self.admitted += 1
+
+    async def acquire_ai(self, chat_id):
+        """Забирає токен загального бюджету перед запитом до ШІ; кидає Rejected("overloaded"), якщо його вичерпано"""
+        if not await self.global_bucket.try_acquire():
+            bucket = self.buckets.get(chat_id)
+            if bucket is not None:
+                # токен чату повертається: запит відкинуто не через цього користувача
+                bucket.tokens += 1
+            self._reject("overloaded")
+
+    def release(self, chat_id):
+        self.in_flight.discard(chat_id)
+
+    def stats(self):
+        return {"in_flight": len(self.in_flight), "admitted": self.admitted, "rejected": dict(self.rejected)}
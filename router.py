@@ -0,0 +1,33 @@
+class Router:
+    """Вибирає обробник текстового повідомлення за два пошуки у словниках.
+
+    Спершу шукається точний текст кнопки, потім поточний крок діалогу, тому вартість маршрутизації
+    не залежить від кількості обробників (на відміну від перебору func-фільтрів telebot).
+    """
+
+    def __init__(self):
+        self.by_text = {}
+        self.by_step = {}
+
+    @staticmethod
+    def _register(routes, keys, kind):
+        def decorator(handler):
+            for key in keys:
+                if key in routes:
+                    raise ValueError(f"{kind} {key!r} is already routed to {routes[key].__name__}")
+                routes[key] = handler
+            return handler
+        return decorator
+
+    def text(self, *texts):
+        return self._register(self.by_text, texts, "text")
+
+    def step(self, *steps):
+        return self._register(self.by_step, steps, "step")
+
+    def resolve(self, text, step):
+        """Повертає обробник для тексту й кроку або None"""
+        handler = self.by_text.get(text)
+        if handler is None:
+            handler = self.by_step.get(step)
+        return handler
@@ -0,0 +1,105 @@
+import abc
+import asyncio
+import json
+import time
+
+import storage
+from cache import TTLCache
+
+
+class Session:
+    """Стан діалогу з одним чатом"""
+
+    __slots__ = ("chat_id", "step", "genre", "favorites", "preferences", "recommendations",
+                 "last_selected_film", "last_action")
+    FIELDS = __slots__[1:]
+
+    def __init__(self, chat_id, step=None, genre="", favorites=None, preferences="", recommendations=None,
+                 last_selected_film=None, last_action=None):
+        self.chat_id = chat_id
+        self.step = step
+        self.genre = genre
+        self.favorites = favorites or []
+        self.preferences = preferences
+        self.recommendations = recommendations or []
+        self.last_selected_film = last_selected_film
+        self.last_action = last_action
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, chat_id, data):
+        return cls(chat_id, **{field: data[field] for field in cls.FIELDS if field in data})
+
+
+class SessionStore(abc.ABC):
+    """Інтерфейс сховища сесій. get() завжди повертає сесію: нову, якщо чат ще невідомий"""
+
+    @abc.abstractmethod
+    async def get(self, chat_id):
+        ...
+
+    @abc.abstractmethod
+    async def save(self, session):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, chat_id):
+        ...
+
+    async def purge(self):
+        pass
+
+    async def update(self, chat_id, **fields):
+        """Читає сесію, змінює вказані поля і одразу зберігає"""
+        session = await self.get(chat_id)
+        for name, value in fields.items():
+            setattr(session, name, value)
+        await self.save(session)
+        return session
+
+
+class MemorySessionStore(SessionStore):
+    """Сесії в пам'яті процесу: не більше maxsize чатів, неактивні довше ttl секунд забуваються"""
+
+    def __init__(self, maxsize=10000, ttl=7 * 86400):
+        self._sessions = TTLCache(maxsize, ttl)
+
+    async def get(self, chat_id):
+        return self._sessions.get(chat_id) or Session(chat_id)
+
+    async def save(self, session):
+        self._sessions.set(session.chat_id, session)
+
+    async def delete(self, chat_id):
+        self._sessions.pop(chat_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Сесії в SQLite: переживають перезапуск і спільні для кількох процесів бота"""
+
+    def __init__(self, ttl=7 * 86400):
+        self.ttl = ttl
+
+    async def get(self, chat_id):
+        row = await asyncio.to_thread(storage.load_session, chat_id, int(time.time()) - self.ttl)
+        return Session.from_dict(chat_id, json.loads(row)) if row else Session(chat_id)
+
+    async def save(self, session):
+        data = json.dumps(session.to_dict(), ensure_ascii=False)
+        await asyncio.to_thread(storage.save_session, session.chat_id, data)
+
+    async def delete(self, chat_id):
+        await asyncio.to_thread(storage.delete_session, chat_id)
+
+    async def purge(self):
+        await asyncio.to_thread(storage.purge_sessions, int(time.time()) - self.ttl)
+
+
+def create_session_store(backend, cache_size=10000, ttl=7 * 86400):
+    if backend == "memory":
+        return MemorySessionStore(cache_size, ttl)
+    if backend == "sqlite":
+        return SQLiteSessionStore(ttl)
+    raise ValueError(f"Unknown session store: {backend}")
@@ -0,0 +1,359 @@
+"""Локальний пошук схожих фільмів за знімком каталогу TMDB, без запитів до ШІ.
+
+Індекс будується офлайн з дампу (JSON, JSON Lines або CSV з полями id, title, original_title,
+release_date, genres, keywords, overview, popularity):
+
+    python similarity.py build tmdb_movies.csv data/similarity [nlist]
+    python similarity.py query data/similarity "Інтерстеллар (2014)"
+"""
+import os
+import re
+import csv
+import sys
+import json
+import math
+import time
+import hashlib
+from collections import Counter
+
+import numpy as np
+
+from ann import IVFIndex
+from tmdb import clean_film_title, normalize_title
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]{3,}")
+YEAR_PATTERN = re.compile(r"\((\d{4})\)")
+FIELD_WEIGHTS = {"g": 3.0, "k": 2.0, "w": 1.0}
+# фільм, у якого в словнику менше відомих термів, отримує нульовий вектор: схожі для нього не шукаються
+MIN_KNOWN_TERMS = 3
+VECTORS_FILE = "vectors.npy"
+FILMS_FILE = "films.npy"
+TITLES_FILE = "titles.npy"
+TITLE_INDEX_FILE = "title_index.npy"
+ID_INDEX_FILE = "id_index.npy"
+FILM_DTYPE = np.dtype([("id", np.int64), ("year", np.int16), ("popularity", np.float32),
+                       ("title_start", np.int64), ("title_length", np.int32)])
+TITLE_INDEX_DTYPE = np.dtype([("hash", np.uint64), ("row", np.int64)])
+FILM_FIELDS = ("id", "title", "original_title", "year", "popularity")
+TERMS_FILE = "terms.json"
+PROJECTION_FILE = "projection.npy"
+
+
+def _names(value):
+    """Жанри/ключові слова з дампу: список рядків, список {"name": ...}, JSON-рядок або "a|b" """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith("["):
+            return _names(json.loads(value))
+        return [part.strip() for part in re.split(r"[|,]", value) if part.strip()]
+    return [item["name"] if isinstance(item, dict) else str(item) for item in value]
+
+
+def film_from_record(record):
+    """Фільм з рядка дампу або з деталей TMDB у форматі, з якого рахуються терми"""
+    release_date = record.get("release_date") or ""
+    try:
+        popularity = float(record.get("popularity") or 0)
+    except ValueError:
+        popularity = 0.0
+    return {
+        "id": int(record["id"]),
+        "title": record.get("title") or record.get("original_title") or "",
+        "original_title": record.get("original_title") or "",
+        "year": release_date[:4] or str(record.get("year") or ""),
+        "genres": _names(record.get("genres")),
+        "keywords": _names(record.get("keywords")),
+        "overview": record.get("overview") or "",
+        "popularity": popularity,
+    }
+
+
+def load_catalog(path):
+    """Читає дамп TMDB і повертає список фільмів з однаковим набором полів"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            records = list(csv.DictReader(f))
+        else:
+            text = f.read()
+            if text.lstrip().startswith("["):
+                records = json.loads(text)
+            else:
+                records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [film_from_record(record) for record in records if record.get("id") and (record.get("title") or record.get("original_title"))]
+
+
+def film_terms(film):
+    """Терми фільму з префіксом поля: g: жанр, k: ключове слово, w: слово з назви чи опису"""
+    terms = Counter()
+    terms.update("g:" + genre.lower() for genre in film["genres"])
+    terms.update("k:" + keyword.lower() for keyword in film["keywords"])
+    text = f"{film['title']} {film['overview']}".lower()
+    terms.update("w:" + word for word in TOKEN_PATTERN.findall(text))
+    return terms
+
+
+def title_hash(title):
+    """64-бітний хеш нормалізованої назви; однаковий у всіх процесах, на відміну від hash()"""
+    digest = hashlib.blake2b(normalize_title(title).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class FilmTable:
+    """Фільми основного сегмента у масивах numpy, які відкриваються через mmap.
+
+    films — id, рік, популярність і положення назви в titles (байти UTF-8 підряд); title_index —
+    пари (хеш назви, рядок), відсортовані за хешем; id_index — відсортовані id. Пошук іде бінарним
+    пошуком по цих масивах, тож при завантаженні нічого не розбирається, а сторінки спільні для процесів.
+    """
+
+    def __init__(self, films, titles, title_index, id_index):
+        self.films = films
+        self.titles = titles
+        self.title_index = title_index
+        self.id_index = id_index
+
+    @classmethod
+    def from_films(cls, films):
+        table = np.zeros(len(films), dtype=FILM_DTYPE)
+        encoded = []
+        hashes = []
+        start = 0
+        for i, film in enumerate(films):
+            title = film["title"].encode("utf-8")
+            year = str(film.get("year") or "")
+            table[i] = (film["id"], int(year) if year.isdigit() else 0, film.get("popularity") or 0, start, len(title))
+            encoded.append(title)
+            start += len(title)
+            for name in {normalize_title(film["title"]), normalize_title(film.get("original_title") or "")}:
+                if name:
+                    hashes.append((title_hash(name), i))
+        title_index = np.array(hashes, dtype=TITLE_INDEX_DTYPE)
+        title_index.sort(order=["hash", "row"])
+        titles = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(table, titles, title_index, np.sort(table["id"]))
+
+    def save(self, path):
+        np.save(os.path.join(path, FILMS_FILE), self.films)
+        np.save(os.path.join(path, TITLES_FILE), self.titles)
+        np.save(os.path.join(path, TITLE_INDEX_FILE), self.title_index)
+        np.save(os.path.join(path, ID_INDEX_FILE), self.id_index)
+
+    @classmethod
+    def load(cls, path):
+        return cls(*(np.load(os.path.join(path, name), mmap_mode="r")
+                     for name in (FILMS_FILE, TITLES_FILE, TITLE_INDEX_FILE, ID_INDEX_FILE)))
+
+    def __len__(self):
+        return len(self.films)
+
+    def __contains__(self, movie_id):
+        i = np.searchsorted(self.id_index, movie_id)
+        return i < len(self.id_index) and self.id_index[i] == movie_id
+
+    def film(self, row):
+        record = self.films[row]
+        start = int(record["title_start"])
+        year = int(record["year"])
+        return {
+            "id": int(record["id"]),
+            "title": bytes(self.titles[start:start + int(record["title_length"])]).decode("utf-8"),
+            "year": str(year) if year else "",
+            "popularity": float(record["popularity"]),
+        }
+
+    def rows(self, title):
+        """Рядки фільмів з такою назвою (збіг 64-бітних хешів різних назв практично неможливий)"""
+        hashes = self.title_index["hash"]
+        key = np.uint64(title_hash(title))
+        start, end = np.searchsorted(hashes, key, "left"), np.searchsorted(hashes, key, "right")
+        return [int(row) for row in self.title_index["row"][start:end]]
+
+
+class SimilarityIndex:
+    """Вектори фільмів (TF-IDF, стиснутий випадковою проекцією) і пошук найближчих за косинусом.
+
+    Основний сегмент лежить у .npy файлах, відкритих через mmap, і для великих каталогів має
+    IVF-індекс (див. ann.py). Фільми, додані після побудови, потрапляють у невеликий дельта-сегмент,
+    який переглядається повністю; `python similarity.py build` з новим дампом зливає його з основним.
+    """
+
+    def __init__(self, vectors, catalog, terms, projection, ivf=None, popularity_weight=0.05):
+        self.vectors = vectors
+        self.catalog = catalog
+        self.columns = {term: i for i, term in enumerate(terms["vocabulary"])}
+        self.idf = np.asarray(terms["idf"], dtype=np.float32)
+        self.projection = projection
+        self.ivf = ivf
+        self.popularity_weight = popularity_weight
+        popularity = np.log1p(np.asarray(catalog.films["popularity"], dtype=np.float32))
+        self.popularity_scale = float(popularity.max()) or 1.0
+        self.popularity = popularity / self.popularity_scale
+        self.base_size = len(catalog)
+        self.delta = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        self.delta_films = []
+        self.delta_ids = set()
+        self.delta_titles = {}
+
+    def __len__(self):
+        return self.base_size + len(self.delta_films)
+
+    def film(self, index):
+        if index < self.base_size:
+            return self.catalog.film(index)
+        return self.delta_films[index - self.base_size]
+
+    def vectorize(self, terms):
+        """Вектор фільму за його термами; терми поза словником ігноруються"""
+        known = [(self.columns[term], count, FIELD_WEIGHTS[term[0]]) for term, count in terms.items() if term in self.columns]
+        vector = np.zeros(self.projection.shape[1], dtype=np.float32)
+        if len(known) >= MIN_KNOWN_TERMS:
+            cols = np.array([col for col, _, _ in known])
+            weights = np.array([(1 + math.log(count)) * weight for _, count, weight in known], dtype=np.float32) * self.idf[cols]
+            vector = (weights / np.linalg.norm(weights)) @ np.asarray(self.projection[cols])
+            vector /= np.linalg.norm(vector) or 1
+        return vector
+
+    @classmethod
+    def build(cls, films, dim=256, max_features=100000, min_df=2, nlist=None, seed=0):
+        """nlist=None — IVF для каталогів від 10000 фільмів, 0 — без IVF (точний пошук)"""
+        documents = [film_terms(film) for film in films]
+        df = Counter(term for terms in documents for term in terms)
+        vocabulary = [term for term, count in df.most_common(max_features) if count >= min_df or term.startswith("g:")]
+        terms = {
+            "vocabulary": vocabulary,
+            "idf": [math.log((1 + len(films)) / (1 + df[term])) + 1 for term in vocabulary],
+        }
+
+        # випадкова проекція зберігає косинусну близькість, але вектор має dim чисел замість розміру словника
+        projection = np.random.default_rng(seed).standard_normal((len(vocabulary), dim), dtype=np.float32)
+        index = cls(np.zeros((len(films), dim), dtype=np.float32), FilmTable.from_films(films), terms, projection)
+        for i, terms_ in enumerate(documents):
+            index.vectors[i] = index.vectorize(terms_)
+
+        if nlist is None:
+            nlist = int(4 * math.sqrt(len(films))) if len(films) >= 10000 else 0
+        if nlist:
+            # рядки переставляються так, щоб кожна група IVF була суцільним зрізом файлу
+            ivf, order = IVFIndex.build(index.vectors, nlist, seed=seed)
+            return cls(index.vectors[order], FilmTable.from_films([films[i] for i in order]), terms, projection, ivf)
+        return index
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, VECTORS_FILE), self.vectors)
+        np.save(os.path.join(path, PROJECTION_FILE), self.projection)
+        self.catalog.save(path)
+        with open(os.path.join(path, TERMS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"vocabulary": list(self.columns), "idf": self.idf.tolist()}, f, ensure_ascii=False)
+        if self.ivf is not None:
+            self.ivf.save(path)
+
+    @classmethod
+    def load(cls, path, nprobe=32):
+        """Вектори й фільми відкриваються через mmap: старт миттєвий, а сторінки спільні для процесів"""
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        projection = np.load(os.path.join(path, PROJECTION_FILE), mmap_mode="r")
+        films = FilmTable.load(path)
+        with open(os.path.join(path, TERMS_FILE), encoding="utf-8") as f:
+            terms = json.load(f)
+        return cls(vectors, films, terms, projection, IVFIndex.load(path, nprobe))
+
+    def __contains__(self, movie_id):
+        return movie_id in self.delta_ids or movie_id in self.catalog
+
+    def add(self, film, vector=None):
+        """Додає фільм у дельта-сегмент; повертає вектор (щоб зберегти його) або None, якщо фільм
+        уже є або про нього відомо надто мало термів"""
+        if film["id"] in self:
+            return None
+        if vector is None:
+            vector = self.vectorize(film_terms(film))
+        if not vector.any():
+            # нульовий вектор однаково далекий від усіх фільмів і лише засмічував би результати
+            return None
+        meta = {key: film.get(key) or "" for key in FILM_FIELDS}
+        meta["popularity"] = meta["popularity"] or 0
+        self.delta_films.append(meta)
+        self.delta_ids.add(meta["id"])
+        self.delta = np.vstack([self.delta, vector[None, :]])
+        self.popularity = np.append(self.popularity, math.log1p(meta["popularity"]) / self.popularity_scale)
+        for title in {normalize_title(meta["title"]), normalize_title(meta["original_title"])}:
+            if title:
+                self.delta_titles.setdefault(title, []).append(len(self) - 1)
+        return vector
+
+    def add_delta(self, rows):
+        """Додає збережені фільми дельта-сегмента: рядки (json фільму, байти вектора)"""
+        for data, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if len(vector) == self.delta.shape[1]:
+                self.add(json.loads(data), vector)
+
+    def vector(self, index):
+        if index < self.base_size:
+            return np.asarray(self.vectors[index])
+        return self.delta[index - self.base_size]
+
+    def find(self, text):
+        """Знаходить фільм за назвою у форматі ШІ ("1) Назва (рік)"); повертає індекс або None"""
+        title = normalize_title(clean_film_title(text))
+        candidates = self.catalog.rows(title) + self.delta_titles.get(title, [])
+        if not candidates:
+            return None
+        year = YEAR_PATTERN.search(text)
+        if year:
+            same_year = [i for i in candidates if self.film(i)["year"] == year.group(1)]
+            candidates = same_year or candidates
+        return max(candidates, key=lambda i: self.popularity[i])
+
+    def nearest(self, vector, k, exclude=(), exact=False):
+        if self.ivf is not None and not exact:
+            rows, scores = self.ivf.search(self.vectors, vector)
+        else:
+            rows, scores = np.arange(self.base_size), np.asarray(self.vectors @ vector)
+        if len(self.delta):
+            rows = np.concatenate([rows, np.arange(self.base_size, len(self))])
+            scores = np.concatenate([scores, self.delta @ vector])
+        scores = scores + self.popularity_weight * self.popularity[rows]
+        if exclude:
+            scores[np.isin(rows, list(exclude))] = -np.inf
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return rows[top[np.argsort(-scores[top])]].tolist()
+
+    def similar(self, text, k=5):
+        """Повертає до k фільмів, схожих на вказаний, або порожній список, якщо його немає в каталозі
+        або про нього відомо надто мало (тоді схожі підбирає ШІ)"""
+        index = self.find(text)
+        if index is None:
+            return []
+        vector = self.vector(index)
+        if not vector.any():
+            return []
+        return [self.film(i) for i in self.nearest(vector, k, exclude=(index,))]
+
+
+def format_film(film):
+    return f"{film['title']} ({film['year']})" if film.get("year") else film["title"]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "build":
+        start = time.perf_counter()
+        films = load_catalog(sys.argv[2])
+        nlist = int(sys.argv[4]) if len(sys.argv) == 5 else None
+        SimilarityIndex.build(films, nlist=nlist).save(sys.argv[3])
+        print(f"{len(films)} films indexed in {time.perf_counter() - start:.1f}s")
+    elif len(sys.argv) == 4 and sys.argv[1] == "query":
+        index = SimilarityIndex.load(sys.argv[2])
+        start = time.perf_counter()
+        films = index.similar(sys.argv[3], k=10)
+        print(f"{(time.perf_counter() - start) * 1000:.1f} ms")
+        for film in films:
+            print(format_film(film))
+    else:
+        print(__doc__)
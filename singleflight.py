@@ -0,0 +1,54 @@
+import asyncio
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Об'єднує однакові одночасні виклики.
+
+    Поки виклик з ключем key виконується, інші виклики з тим самим ключем не запускають новий,
+    а чекають на його результат або помилку. Скасування одного з тих, хто чекає, не скасовує
+    спільний виклик, поки на нього чекають інші; коли йде останній, виклик скасовується.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.started = 0
+        self.shared = 0
+
+    def _done(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            # позначає помилку як отриману, навіть якщо всі, хто чекав, уже пішли
+            call.task.exception()
+
+    async def do(self, key, fn):
+        """Повертає результат корутини fn(), запущеної один раз на всіх одночасних викликів з key"""
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda t: self._done(key, call))
+            self.started += 1
+        else:
+            self.shared += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                # ніхто більше не чекає: запит до ШІ чи TMDB не має тривати далі,
+                # а наступний виклик з цим key запустить новий
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "started": self.started, "shared": self.shared}
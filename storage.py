@@ -0,0 +1,453 @@
+import sqlite3
+import threading
+import time
+
+import metrics
+
+DB_FILE = "user_films.db"
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA busy_timeout=5000",
+)
+
+SQLITE_LATENCY = metrics.histogram(
+    "sqlite_query_seconds", "Time of one storage function call", ["query"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+
+_local = threading.local()
+
+
+def get_connection():
+    """Повертає з'єднання поточного потоку (одне на потік, відкривається один раз)"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+    return conn
+
+
+def timed(fn):
+    """Записує тривалість кожного виклику функції сховища в SQLITE_LATENCY з міткою query=ім'я функції"""
+    return metrics.timed(SQLITE_LATENCY, query=fn.__name__)(fn)
+
+
+# Кожна міграція — (версія, інструкції). Поточна версія схеми зберігається в PRAGMA user_version,
+# тому init_db() безпечно оновлює наявні файли user_films.db на місці.
+MIGRATIONS = (
+    (1, (
+        '''
+        CREATE TABLE IF NOT EXISTS recommendations (
+            user_id INTEGER,
+            film TEXT,
+            genre TEXT,
+            preferences TEXT
+        )
+        ''',
+    )),
+    (2, (
+        '''
+        CREATE TABLE recommendations_v2 (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            film TEXT NOT NULL,
+            genre TEXT,
+            preferences TEXT,
+            created_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+        )
+        ''',
+        '''
+        INSERT INTO recommendations_v2 (user_id, film, genre, preferences)
+        SELECT user_id, film, genre, preferences FROM recommendations
+        WHERE user_id IS NOT NULL AND film IS NOT NULL
+        GROUP BY user_id, film
+        ORDER BY MIN(rowid)
+        ''',
+        'DROP TABLE recommendations',
+        'ALTER TABLE recommendations_v2 RENAME TO recommendations',
+        'CREATE UNIQUE INDEX idx_recommendations_user_film ON recommendations (user_id, film)',
+    )),
+    (3, (
+        '''
+        CREATE TABLE llm_cache (
+            prompt_hash TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+        ''',
+        'CREATE INDEX idx_llm_cache_expires_at ON llm_cache (expires_at)',
+    )),
+    (4, (
+        '''
+        CREATE TABLE sessions (
+            chat_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+        ''',
+        'CREATE INDEX idx_sessions_updated_at ON sessions (updated_at)',
+    )),
+    (5, (
+        '''
+        CREATE TABLE film_vectors (
+            movie_id INTEGER PRIMARY KEY,
+            film TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            created_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+        )
+        ''',
+    )),
+    (6, (
+        '''
+        CREATE TABLE titles (
+            title TEXT PRIMARY KEY,
+            movie_id INTEGER NOT NULL
+        )
+        ''',
+    )),
+    (7, (
+        '''
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_until REAL,
+            error TEXT,
+            created_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
+            updated_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+        )
+        ''',
+        'CREATE INDEX idx_jobs_status ON jobs (status, id)',
+        # у чату може бути лише одне незавершене завдання
+        "CREATE UNIQUE INDEX idx_jobs_active_chat ON jobs (chat_id) WHERE status IN ('queued', 'running')",
+    )),
+    (8, (
+        '''
+        CREATE TABLE posters (
+            movie_id INTEGER NOT NULL,
+            poster_path TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            updated_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
+            PRIMARY KEY (movie_id, poster_path)
+        )
+        ''',
+    )),
+    (9, (
+        '''
+        CREATE TABLE rate_limits (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+        ''',
+    )),
+    # назви з запитів користувачів могли вказувати на інший фільм ("Rocky III" → "Rocky II");
+    # індекс наповниться знову назвами з деталей фільмів
+    (10, (
+        'DELETE FROM titles',
+    )),
+)
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Застосовує всі нові міграції, кожну в окремій транзакції"""
+    for version, statements in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # інший процес міг встигнути застосувати цю міграцію
+            if version > get_schema_version(conn):
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def init_db():
+    conn = get_connection()
+    migrate(conn)
+    purge_cached_responses()
+
+
+@timed
+def save_recommendations(user_id, films, genre, preferences):
+    """Зберігає всі фільми однієї рекомендації в одній транзакції"""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            '''
+            INSERT INTO recommendations (user_id, film, genre, preferences) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, film) DO UPDATE SET
+                genre = excluded.genre,
+                preferences = excluded.preferences,
+                created_at = excluded.created_at
+            ''',
+            [(user_id, film, genre, preferences) for film in films]
+        )
+
+
+@timed
+def get_user_recommendations(user_id):
+    conn = get_connection()
+    rows = conn.execute('SELECT film FROM recommendations WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+    return [row[0] for row in rows]
+
+
+@timed
+def clear_user_recommendations(user_id):
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM recommendations WHERE user_id = ?', (user_id,))
+
+
+@timed
+def get_cached_response(prompt_hash):
+    """Повертає (response, expires_at) з постійного кешу ШІ або None"""
+    conn = get_connection()
+    return conn.execute(
+        'SELECT response, expires_at FROM llm_cache WHERE prompt_hash = ? AND expires_at > ?',
+        (prompt_hash, int(time.time()))
+    ).fetchone()
+
+
+@timed
+def save_cached_response(prompt_hash, response, expires_at):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO llm_cache (prompt_hash, response, expires_at) VALUES (?, ?, ?)',
+            (prompt_hash, response, expires_at)
+        )
+
+
+@timed
+def purge_cached_responses():
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (int(time.time()),))
+
+
+@timed
+def load_session(chat_id, updated_after):
+    conn = get_connection()
+    row = conn.execute(
+        'SELECT data FROM sessions WHERE chat_id = ? AND updated_at > ?', (chat_id, updated_after)
+    ).fetchone()
+    return row[0] if row else None
+
+
+@timed
+def save_session(chat_id, data):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO sessions (chat_id, data, updated_at) VALUES (?, ?, ?)',
+            (chat_id, data, int(time.time()))
+        )
+
+
+@timed
+def delete_session(chat_id):
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM sessions WHERE chat_id = ?', (chat_id,))
+
+
+@timed
+def purge_sessions(updated_before):
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM sessions WHERE updated_at <= ?', (updated_before,))
+
+
+@timed
+def save_film_vector(movie_id, film, vector):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR IGNORE INTO film_vectors (movie_id, film, vector) VALUES (?, ?, ?)',
+            (movie_id, film, vector)
+        )
+
+
+@timed
+def get_film_vectors():
+    """Фільми, додані в індекс схожості після його побудови: (json фільму, байти вектора)"""
+    conn = get_connection()
+    return conn.execute('SELECT film, vector FROM film_vectors ORDER BY movie_id').fetchall()
+
+
+@timed
+def save_titles(rows):
+    """Зберігає пари (нормалізована назва, movie_id) для нечіткого пошуку назв"""
+    conn = get_connection()
+    with conn:
+        conn.executemany('INSERT OR IGNORE INTO titles (title, movie_id) VALUES (?, ?)', rows)
+
+
+@timed
+def get_titles():
+    conn = get_connection()
+    return conn.execute('SELECT title, movie_id FROM titles').fetchall()
+
+
+@timed
+def enqueue_job(kind, chat_id, payload):
+    """Додає завдання в чергу; повертає його id або None, якщо в чату вже є незавершене завдання"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO jobs (kind, chat_id, payload) VALUES (?, ?, ?)', (kind, chat_id, payload)
+        )
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+@timed
+def claim_job(now, lease_until, max_attempts):
+    """Бере найстаріше завдання з черги або завдання з простроченою орендою (воркер упав).
+
+    Повертає (id, kind, chat_id, payload, attempts) або None.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            '''
+            SELECT id, kind, chat_id, payload, attempts FROM jobs
+            WHERE status = 'queued' OR (status = 'running' AND lease_until < ? AND attempts < ?)
+            ORDER BY id LIMIT 1
+            ''',
+            (now, max_attempts)
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                (lease_until, int(now), row[0])
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if row is None:
+        return None
+    job_id, kind, chat_id, payload, attempts = row
+    return job_id, kind, chat_id, payload, attempts + 1
+
+
+@timed
+def fail_abandoned_jobs(now, max_attempts):
+    """Позначає невдалими завдання, які вже max_attempts разів лишалися недоробленими; повертає їх"""
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            '''
+            SELECT id, kind, chat_id, payload, attempts FROM jobs
+            WHERE status = 'running' AND lease_until < ? AND attempts >= ?
+            ''',
+            (now, max_attempts)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE jobs SET status = 'failed', error = 'abandoned', updated_at = ? WHERE id = ?",
+            [(int(now), row[0]) for row in rows]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+
+@timed
+def finish_job(job_id, error=None):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?',
+            ('failed' if error else 'done', error, int(time.time()), job_id)
+        )
+
+
+@timed
+def count_jobs():
+    """Кількість завдань за статусом і вік найстарішого завдання в черзі, секунд"""
+    conn = get_connection()
+    counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+    oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+    return counts, int(time.time()) - oldest if oldest else 0
+
+
+@timed
+def purge_jobs(updated_before):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at <= ?", (updated_before,))
+
+
+@timed
+def get_poster_file_id(movie_id, poster_path):
+    conn = get_connection()
+    row = conn.execute(
+        'SELECT file_id FROM posters WHERE movie_id = ? AND poster_path = ?', (movie_id, poster_path)
+    ).fetchone()
+    return row[0] if row else None
+
+
+@timed
+def save_poster_file_id(movie_id, poster_path, file_id):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO posters (movie_id, poster_path, file_id, updated_at) VALUES (?, ?, ?, ?)',
+            (movie_id, poster_path, file_id, int(time.time()))
+        )
+
+
+@timed
+def delete_poster_file_id(movie_id, poster_path):
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM posters WHERE movie_id = ? AND poster_path = ?', (movie_id, poster_path))
+
+
+@timed
+def reserve_tokens(name, now, rate, capacity, tokens=1, debt=True):
+    """Забирає tokens з відра name, спільного для всіх процесів; повертає, скільки секунд чекати,
+    поки їх покриє поповнення (відро може піти в мінус — так резерви процесів стають у чергу).
+
+    З debt=False токени забираються, лише якщо вони вже є; інакше відро не змінюється.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute('SELECT tokens, updated FROM rate_limits WHERE name = ?', (name,)).fetchone()
+        available = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+        if not debt and available < tokens:
+            conn.rollback()
+            return (tokens - available) / rate
+        available -= tokens
+        conn.execute(
+            'INSERT OR REPLACE INTO rate_limits (name, tokens, updated) VALUES (?, ?, ?)', (name, available, now)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return max(0.0, -available / rate)
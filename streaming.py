@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+
+async def read_stream(stream, on_line):
+    """Збирає потокову відповідь ШІ і викликає on_line для кожного рядка, щойно він завершився"""
+    parts = []
+    pending = ""
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        parts.append(delta)
+        pending += delta
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            on_line(line)
+    if pending:
+        # останній рядок може прийти без \n у кінці
+        on_line(pending)
+    return "".join(parts)
+
+
+class StreamingMessage:
+    """Дописує знайдені фільми у повідомлення-заглушку по мірі надходження.
+
+    Редагування йдуть у фоні і не частіше ніж раз на interval секунд, щоб не впертися в ліміти
+    Telegram на редагування; рядки, що прийшли між редагуваннями, потрапляють у наступне.
+    """
+
+    def __init__(self, bot, chat_id, message_id, header, interval=1.5):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.header = header
+        self.interval = interval
+        self.lines = []
+        self._shown = 0
+        self._last_edit = 0.0
+        self._task = None
+
+    def add(self, line):
+        self.lines.append(line)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._update())
+
+    async def _update(self):
+        while self._shown < len(self.lines):
+            delay = self._last_edit + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            shown = len(self.lines)
+            try:
+                await self.bot.edit_message_text(self.header + "\n" + "\n".join(self.lines[:shown]), self.chat_id, self.message_id)
+            except Exception:
+                pass
+            self._shown = shown
+            self._last_edit = time.monotonic()
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
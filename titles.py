@@ -0,0 +1,105 @@
+import re
+import asyncio
+from collections import Counter
+
+import storage
+
+NON_WORD = re.compile(r"[\W_]+")
+NUMBERS = re.compile(r"\d+")
+ROMAN = re.compile(r"(?=[ivxlc])c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})")
+# римські цифри часто пишуть кирилицею: "Частина ІІІ"
+CYRILLIC_ROMAN = str.maketrans("іх", "ix")
+
+
+def normalize(title):
+    """Нижній регістр, без розділових знаків і апострофів"""
+    return " ".join(NON_WORD.sub(" ", title.lower().replace("'", "").replace("’", "").replace("ʼ", "")).split())
+
+
+def numbers(title):
+    """Арабські та римські числа нормалізованої назви: за ними розрізняються частини серій"""
+    roman = [word for word in title.translate(CYRILLIC_ROMAN).split() if ROMAN.fullmatch(word)]
+    return NUMBERS.findall(title) + roman
+
+
+def trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Нечіткий пошук movie_id за назвою через триграмний інвертований індекс.
+
+    Наповнюється українськими та оригінальними назвами з деталей фільмів TMDB. Різні написання
+    однієї назви ("Інтерстеллар" і "Інтерстелар") дають той самий movie_id без запиту до TMDB.
+    Назви з різною кількістю слів або різними числами, зокрема римськими ("Темний лицар" і "Темний
+    лицар повертається", "Термінатор 2" і "Термінатор 3", "Rocky II" і "Rocky III"), ніколи не
+    вважаються однаковими.
+    """
+
+    def __init__(self, threshold=0.8, persistent=False, min_length=4):
+        self.threshold = threshold
+        self.persistent = persistent
+        self.min_length = min_length
+        self.exact = {}
+        self.titles = []
+        self.postings = {}
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.exact)
+
+    def _add(self, title, movie_id):
+        """Додає назву в пам'ять; повертає True, якщо вона нова"""
+        if not title or title in self.exact:
+            return False
+        self.exact[title] = movie_id
+        position = len(self.titles)
+        self.titles.append((title, len(trigrams(title)), movie_id))
+        for gram in trigrams(title):
+            self.postings.setdefault(gram, []).append(position)
+        return True
+
+    async def load(self):
+        if self.persistent:
+            for title, movie_id in await asyncio.to_thread(storage.get_titles):
+                self._add(title, movie_id)
+
+    async def add(self, movie_id, *titles):
+        new = [(title, movie_id) for title in {normalize(title) for title in titles if title} if self._add(title, movie_id)]
+        if new and self.persistent:
+            await asyncio.to_thread(storage.save_titles, new)
+
+    def resolve(self, title):
+        """Повертає movie_id для точного або достатньо схожого запису, інакше None"""
+        title = normalize(title)
+        movie_id = self.exact.get(title)
+        if movie_id is not None:
+            self.hits += 1
+            return movie_id
+        if len(title) < self.min_length:
+            self.misses += 1
+            return None
+
+        grams = trigrams(title)
+        common = Counter()
+        for gram in grams:
+            common.update(self.postings.get(gram, ()))
+        words = title.count(" ")
+        title_numbers = numbers(title)
+        best_score, best_id = 0.0, None
+        for position, count in common.items():
+            candidate, size, movie_id = self.titles[position]
+            score = 2 * count / (len(grams) + size)
+            if score > best_score and candidate.count(" ") == words and numbers(candidate) == title_numbers:
+                best_score, best_id = score, movie_id
+        if best_score >= self.threshold:
+            self.fuzzy_hits += 1
+            return best_id
+        self.misses += 1
+        return None
+
+    def stats(self):
+        return {"titles": len(self), "hits": self.hits, "fuzzy_hits": self.fuzzy_hits, "misses": self.misses}
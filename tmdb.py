@@ -0,0 +1,208 @@
+import asyncio
+import random
+import re
+
+import aiohttp
+
+import metrics
+from cache import TTLCache
+from ratelimit import TokenBucket
+from singleflight import SingleFlight
+
+TMDB_API_URL = "https://api.themoviedb.org/3"
+DETAIL_FIELDS = ("id", "title", "original_title", "release_date", "vote_average", "overview", "genres", "poster_path")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_MISSING = object()
+
+TMDB_LATENCY = metrics.histogram("tmdb_request_seconds", "Time of one HTTP request to TMDB, retries counted separately", ["endpoint"])
+TMDB_IN_FLIGHT = metrics.gauge("tmdb_requests_in_flight", "HTTP requests to TMDB in progress")
+TMDB_LOOKUPS = metrics.counter("tmdb_lookups_total", "Film title lookups by where the movie id came from", ["source"])
+TIMEOUTS = metrics.counter("timeouts_total", "Timed out requests by stage", ["stage"])
+
+
+def clean_film_title(text):
+    """Прибирає нумерацію та рік з назви, яку повернув ШІ"""
+    text = re.sub(r"^\d+\)\s*", "", text)
+    text = re.sub(r"\s*\(\d{4}\)", "", text)
+    return text.strip()
+
+
+def normalize_title(title):
+    return " ".join(title.lower().split())
+
+
+class TMDBError(Exception):
+    """Відповідь TMDB з кодом помилки. На відміну від aiohttp.ClientResponseError, текст не містить
+    URL запиту, а отже й api_key"""
+
+    def __init__(self, path, status, reason=None):
+        super().__init__(f"TMDB {path}: {status} {reason or ''}".rstrip())
+        self.status = status
+
+
+class TMDBClient:
+    """Клієнт TMDB з дворівневим кешем: назва → movie_id та movie_id → деталі фільму.
+
+    Назви, для яких TMDB нічого не знайшов, теж кешуються (на коротший час), щоб не повторювати
+    марні пошуки. Запити йдуть через одну сесію з пулом keep-alive з'єднань, обмежуються за
+    частотою, а відповіді 429/5xx повторюються з експоненційною затримкою з урахуванням Retry-After.
+    Авторизація — токеном читання v4 (read_token) у заголовку, а без нього ключем v3 api_key у
+    параметрах запиту. Якщо передано titles (TitleIndex), назва спершу шукається в ньому, і TMDB питають лише про невідомі назви.
+    Однакові одночасні запити (той самий пошук чи той самий фільм) виконуються один раз.
+    on_details(details) викликається для кожного фільму, деталі якого завантажено з TMDB.
+    """
+
+    def __init__(self, api_key, language="uk", cache_size=2000, ttl=86400, negative_ttl=3600,
+                 max_connections=20, rate_limit=40, max_retries=3, backoff=0.5, timeout=10, titles=None, api_url=None,
+                 read_token=None, on_details=None):
+        self.api_key = api_key
+        self.read_token = read_token
+        self.on_details = on_details
+        self.api_url = (api_url or TMDB_API_URL).rstrip("/")
+        self.language = language
+        self.negative_ttl = negative_ttl
+        self.movie_ids = TTLCache(cache_size, ttl)
+        self.details = TTLCache(cache_size, ttl)
+        self.titles = titles
+        self.flight = SingleFlight()
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate_limit)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60, ttl_dns_cache=300),
+                headers={"Authorization": f"Bearer {self.read_token}"} if self.read_token else None,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+
+    async def request(self, path, **params):
+        session = self._get_session()
+        params = {"language": self.language, **params}
+        if not self.read_token:
+            params["api_key"] = self.api_key
+        endpoint = path.split("/")[0]
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                with TMDB_LATENCY.time(endpoint=endpoint), TMDB_IN_FLIGHT.track():
+                    async with session.get(f"{self.api_url}/{path}", params=params) as response:
+                        if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                            if response.status >= 400:
+                                # не raise_for_status(): її помилка містить URL з api_key і потрапила б у лог
+                                raise TMDBError(path, response.status, response.reason)
+                            return await response.json()
+                        delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    TIMEOUTS.inc(stage="tmdb")
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def search_movie_id(self, title):
+        key = normalize_title(title)
+        movie_id = self.movie_ids.get(key, _MISSING)
+        source = "cache"
+        if movie_id is _MISSING and self.titles is not None:
+            movie_id = self.titles.resolve(title)
+            source = "title_index"
+            if movie_id is None:
+                movie_id = _MISSING
+            else:
+                self.movie_ids.set(key, movie_id)
+        if movie_id is _MISSING:
+            source = "search"
+            movie_id = await self.flight.do(("search", key), lambda: self._search_movie_id(title, key))
+        TMDB_LOOKUPS.inc(source=source)
+        return movie_id
+
+    async def _search_movie_id(self, title, key):
+        results = (await self.request("search/movie", query=title)).get("results")
+        movie_id = results[0]["id"] if results else None
+        # запит користувача в TitleIndex не йде: перший результат пошуку TMDB не завжди той самий фільм,
+        # а індекс зберігається без TTL; туди потрапляють лише назви з деталей фільму
+        self.movie_ids.set(key, movie_id, ttl=None if movie_id else self.negative_ttl)
+        return movie_id
+
+    async def get_details(self, movie_id):
+        details = self.details.get(movie_id)
+        if details is None:
+            details = await self.flight.do(("movie", movie_id), lambda: self._fetch_details(movie_id))
+        return details
+
+    async def _fetch_details(self, movie_id):
+        response = await self.request(f"movie/{movie_id}")
+        details = {field: response.get(field) for field in DETAIL_FIELDS if field in response}
+        self.details.set(movie_id, details)
+        if self.titles is not None:
+            await self.titles.add(movie_id, details.get("title"), details.get("original_title"))
+        if self.on_details is not None:
+            try:
+                await self.on_details(details)
+            except Exception:
+                # обробник лише доповнює інші дані (напр. індекс схожості), картка фільму від нього не залежить
+                pass
+        return details
+
+    async def find_movie(self, title):
+        """Повертає деталі фільму за назвою або None, якщо TMDB його не знає"""
+        movie_id = await self.search_movie_id(title)
+        if movie_id is None:
+            return None
+        return await self.get_details(movie_id)
+
+
+class Prefetcher:
+    """Фоново завантажує з TMDB деталі рекомендованих фільмів, щоб перше натискання на фільм
+    відповідало одразу з кешу. Завдання одного чату скасовуються, коли користувач виходить з підбору."""
+
+    def __init__(self, tmdb, concurrency=10):
+        self.tmdb = tmdb
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = {}
+
+    def prefetch(self, chat_id, films):
+        self.cancel(chat_id)
+        tasks = {asyncio.create_task(self._fetch(film)) for film in films}
+        self._tasks[chat_id] = tasks
+        for task in tasks:
+            task.add_done_callback(lambda t, chat_id=chat_id: self._discard(chat_id, t))
+
+    def cancel(self, chat_id):
+        for task in self._tasks.pop(chat_id, ()):
+            task.cancel()
+
+    def _discard(self, chat_id, task):
+        tasks = self._tasks.get(chat_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[chat_id]
+
+    async def _fetch(self, film):
+        async with self.semaphore:
+            try:
+                await self.tmdb.find_movie(clean_film_title(film))
+            except Exception:
+                # попереднє завантаження необов'язкове: при натисканні фільм просто завантажиться ще раз
+                pass
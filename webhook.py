@@ -0,0 +1,205 @@
+import os
+import json
+import queue
+import signal
+import asyncio
+import importlib
+import multiprocessing
+from aiohttp import web
+from dotenv import load_dotenv
+from telebot import types, asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from storage import init_db
+from jobs import JobQueue
+
+load_dotenv()
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", str(os.cpu_count() or 1)))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_BOT_MODULE = os.getenv("WEBHOOK_BOT_MODULE", "main")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+
+
+def update_chat_id(update):
+    """Повертає id чату, до якого належить оновлення (або id користувача, якщо чату немає)"""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return update.get("update_id", 0)
+
+
+def run_worker(module_name, updates, index=0):
+    # Ctrl+C зупиняє лише головний процес, а він завершує воркерів через черги
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ["WORKER_INDEX"] = str(index)
+    asyncio.run(_worker(module_name, updates))
+
+
+async def _worker(module_name, updates):
+    """Обробляє оновлення своєї частини чатів: різні чати паралельно, один чат — строго по черзі"""
+    bot_module = importlib.import_module(module_name)
+    await bot_module.startup()
+    loop = asyncio.get_running_loop()
+    last_tasks = {}
+
+    def forget(chat_id, task):
+        if last_tasks.get(chat_id) is task:
+            del last_tasks[chat_id]
+
+    try:
+        while True:
+            item = await loop.run_in_executor(None, updates.get)
+            if item is None:
+                break
+            chat_id, raw = item
+            task = asyncio.create_task(_process(bot_module.bot, types.Update.de_json(raw), last_tasks.get(chat_id)))
+            last_tasks[chat_id] = task
+            task.add_done_callback(lambda t, chat_id=chat_id: forget(chat_id, t))
+    finally:
+        await asyncio.gather(*last_tasks.values(), return_exceptions=True)
+        await bot_module.close_resources()
+        # сесія HTTP з'являється лише після першого запиту до Bot API
+        if asyncio_helper.session_manager.session is not None:
+            await bot_module.bot.close_session()
+
+
+async def _process(bot, update, previous):
+    if previous is not None:
+        await asyncio.wait([previous])
+    try:
+        await bot.process_new_updates([update])
+    except Exception as e:
+        print(f"[WEBHOOK ERROR] update {update.update_id}: {e}")
+
+
+class WorkerPool:
+    """Процеси-воркери бота; кожен чат завжди потрапляє в один і той самий процес"""
+
+    def __init__(self, module_name, workers, max_queue):
+        self.module_name = module_name
+        self.max_queue = max_queue
+        self.context = multiprocessing.get_context("spawn")
+        self.queues = [self.context.Queue(max_queue) for _ in range(workers)]
+        self.processes = [None] * workers
+        self.dispatched = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def _spawn(self, index):
+        process = self.context.Process(
+            target=run_worker, args=(self.module_name, self.queues[index], index), name=f"bot-worker-{index}", daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(len(self.processes)):
+            self._spawn(index)
+
+    def ensure_alive(self):
+        """Перезапускає воркери, що впали; їхні необроблені оновлення лишаються в черзі"""
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                print(f"[WEBHOOK] worker {index} exited with {process.exitcode}, restarting")
+                self.restarts += 1
+                self._spawn(index)
+
+    def dispatch(self, chat_id, raw):
+        """Ставить оновлення в чергу воркера; повертає False, якщо черга заповнена"""
+        try:
+            self.queues[chat_id % len(self.queues)].put_nowait((chat_id, raw))
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.dispatched += 1
+        return True
+
+    def stop(self, timeout=30):
+        for updates in self.queues:
+            updates.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def stats(self):
+        return {
+            "workers": len(self.processes),
+            "alive": sum(process.is_alive() for process in self.processes),
+            "dispatched": self.dispatched,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
+
+
+def create_app(pool, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+    jobs = JobQueue()
+
+    async def handle_update(request):
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=403)
+        raw = await request.text()
+        try:
+            update = json.loads(raw)
+        except ValueError:
+            return web.Response(status=400)
+        # 503 змушує Telegram повторити доставку пізніше, замість того щоб губити оновлення
+        if not pool.dispatch(update_chat_id(update), raw):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def handle_health(request):
+        return web.json_response({**pool.stats(), "jobs": await jobs.stats()})
+
+    async def watch_workers(app):
+        async def watch():
+            while True:
+                await asyncio.sleep(5)
+                pool.ensure_alive()
+
+        task = asyncio.create_task(watch())
+        yield
+        task.cancel()
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/health", handle_health)
+    app.cleanup_ctx.append(watch_workers)
+    return app
+
+
+async def set_webhook():
+    bot = AsyncTeleBot(TELEGRAM_TOKEN)
+    try:
+        await bot.set_webhook(WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+    finally:
+        await bot.close_session()
+
+
+if __name__ == "__main__":
+    init_db()
+    if WEBHOOK_URL:
+        asyncio.run(set_webhook())
+    pool = WorkerPool(WEBHOOK_BOT_MODULE, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+    pool.start()
+    print(f"Webhook started on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH} with {WEBHOOK_WORKERS} workers")
+    try:
+        web.run_app(create_app(pool), host=WEBHOOK_HOST, port=WEBHOOK_PORT, print=None)
+    finally:
+        pool.stop()
@@ -0,0 +1,120 @@
+"""Локальна перевірка режиму webhook без Telegram.
+
+Запускає фейковий Bot API, на який бот надсилає відповіді, і шле на webhook оновлення від кількох
+чатів одночасно. Наприкінці перевіряє, що кожен чат отримав однакову послідовність відповідей,
+тобто що порядок повідомлень у межах чату не порушився.
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python webhook.py
+    python webhook_sender.py --chats 200
+"""
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+import aiohttp
+from aiohttp import web
+
+SCRIPT = ["/start", "🔍 Новий підбір фільмів", "драма", "⏭️ Пропустити", "⬅️ Повернутись в головне меню"]
+
+
+class FakeBotAPI:
+    """Відповідає на будь-який метод Bot API і запам'ятовує тексти, надіслані в кожен чат"""
+
+    def __init__(self):
+        self.replies = defaultdict(list)
+        self.calls = 0
+        self.message_id = 0
+
+    async def handle(self, request):
+        data = await request.post()
+        self.calls += 1
+        method = request.match_info["method"]
+        chat_id = int(data.get("chat_id", 0))
+        if method.startswith("send") or method.startswith("edit"):
+            self.replies[chat_id].append(data.get("text") or data.get("caption") or method)
+            self.message_id += 1
+            result = {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+def make_update(update_id, chat_id, text):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "test"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+async def send_chat(session, url, headers, chat_id, first_update_id, stats):
+    # у межах чату оновлення йдуть по одному, як їх доставляє Telegram
+    for offset, text in enumerate(SCRIPT):
+        while True:
+            async with session.post(url, json=make_update(first_update_id + offset, chat_id, text), headers=headers) as resp:
+                if resp.status != 503:
+                    stats[resp.status] += 1
+                    break
+            stats[503] += 1
+            await asyncio.sleep(0.1)
+
+
+async def main(args):
+    api = FakeBotAPI()
+    runner = await api.start(args.api_port)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    stats = defaultdict(int)
+    chats = [args.first_chat + i for i in range(args.chats)]
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(
+            send_chat(session, args.url, headers, chat_id, i * len(SCRIPT), stats) for i, chat_id in enumerate(chats)
+        ))
+    sent = time.perf_counter() - start
+
+    # чекаємо, доки бот перестане відповідати
+    previous = -1
+    while previous != api.calls and time.perf_counter() - start < args.timeout:
+        previous = api.calls
+        await asyncio.sleep(1)
+    elapsed = time.perf_counter() - start
+    await runner.cleanup()
+
+    updates = len(chats) * len(SCRIPT)
+    expected = api.replies.get(chats[0], [])
+    in_order = sum(api.replies.get(chat_id) == expected for chat_id in chats)
+    print(f"updates sent:    {updates} in {sent:.2f}s ({updates / sent:.0f}/s), HTTP statuses {dict(stats)}")
+    print(f"bot API calls:   {api.calls} in {elapsed:.2f}s")
+    print(f"replies/chat:    {len(expected)}")
+    print(f"chats in order:  {in_order}/{len(chats)}")
+    return in_order == len(chats) and bool(expected)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--first-chat", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=60)
+    raise SystemExit(0 if asyncio.run(main(parser.parse_args())) else 1)